@@ -0,0 +1,25 @@
+"""
+مُزخرف njit مع بديل آمن
+=======================
+
+يستخدم numba.njit إن كانت numba مثبتة لترجمة الحلقات الرقمية (شمعة بشمعة)،
+وإلا يعيد الدالة كما هي لتعمل بنفس النتائج في Python العادي.
+prange يصبح range عند غياب numba.
+"""
+
+try:
+    from numba import njit, prange
+except ImportError:
+    prange = range
+
+    def njit(*args, **kwargs):
+        """بديل njit: يدعم @njit و @njit(cache=True) دون أي ترجمة"""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+
+        def decorator(func):
+            return func
+
+        return decorator
+
+__all__ = ['njit', 'prange']
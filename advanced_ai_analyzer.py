@@ -14,6 +14,7 @@ import json
 import logging
 from datetime import datetime, timedelta
 import threading
+from collections import defaultdict, deque
 from typing import Dict, List, Tuple, Optional, Any
 import random
 import math
@@ -33,8 +34,9 @@ class AdvancedAIAnalyzer:
         self.accuracy_target = 0.95  # هدف الدقة 95%
         
         # === ذاكرة التعلم والتطوير ===
-        self.learning_memory = {}
-        self.signal_history = []
+        # آخر 100 تحليل لكل أصل وآخر 500 إشارة - الحد يُطبق تلقائياً عند الإضافة
+        self.learning_memory = defaultdict(lambda: deque(maxlen=100))
+        self.signal_history = deque(maxlen=500)
         self.accuracy_tracker = {}
         self.pattern_recognition = {}
         
@@ -422,15 +424,8 @@ class AdvancedAIAnalyzer:
     def _store_analysis_for_learning(self, analysis: Dict):
         """حفظ التحليل في ذاكرة التعلم"""
         
-        asset_id = analysis['asset_id']
-        if asset_id not in self.learning_memory:
-            self.learning_memory[asset_id] = []
-        
-        self.learning_memory[asset_id].append(analysis)
-        
-        # الحفاظ على آخر 100 تحليل لكل أصل
-        if len(self.learning_memory[asset_id]) > 100:
-            self.learning_memory[asset_id].pop(0)
+        # الحفاظ على آخر 100 تحليل لكل أصل (deque بحد أقصى)
+        self.learning_memory[analysis['asset_id']].append(analysis)
 
     def _analyze_signal_outcome(self, signal_id: str, outcome: str, profit_pct: float):
         """تحليل نتيجة الإشارة وتطوير النظام"""
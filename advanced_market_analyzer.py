@@ -19,6 +19,7 @@ import numpy as np
 from typing import Dict, List, Tuple, Optional, Any
 from dataclasses import dataclass
 from enum import Enum
+from _njit import njit
 
 class PatternType(Enum):
     """أنواع الأنماط الفنية"""
@@ -39,6 +40,41 @@ class BreakoutType(Enum):
     FALSE_BREAKOUT = "false_breakout"   # كسر كاذب
     PENDING = "pending"                 # انتظار التأكيد
 
+@njit(cache=True)
+def _candlestick_loop(open_, high, low, close, n):
+    """فحص أنماط الشموع شمعة بشمعة على مصفوفات OHLC (float64)
+
+    يعيد أقنعة منطقية: (المطرقة، الدوجي، البلع الصاعد، البلع الهابط)
+    """
+    hammer = np.zeros(n, dtype=np.bool_)
+    doji = np.zeros(n, dtype=np.bool_)
+    bullish_engulfing = np.zeros(n, dtype=np.bool_)
+    bearish_engulfing = np.zeros(n, dtype=np.bool_)
+    
+    for i in range(n):
+        body_size = abs(close[i] - open_[i])
+        upper_shadow = high[i] - max(open_[i], close[i])
+        lower_shadow = min(open_[i], close[i]) - low[i]
+        
+        hammer[i] = (lower_shadow > body_size * 2 and
+                     upper_shadow < body_size * 0.3 and
+                     body_size > 0)
+        doji[i] = body_size < (high[i] - low[i]) * 0.1
+        
+        if i >= 2:
+            prev_bullish = close[i-1] > open_[i-1]
+            prev_bearish = close[i-1] < open_[i-1]
+            bullish_engulfing[i] = (prev_bearish and
+                                    close[i] > open_[i] and
+                                    open_[i] < close[i-1] and
+                                    close[i] > open_[i-1])
+            bearish_engulfing[i] = (prev_bullish and
+                                    close[i] < open_[i] and
+                                    open_[i] > close[i-1] and
+                                    close[i] < open_[i-1])
+    
+    return hammer, doji, bullish_engulfing, bearish_engulfing
+
 @dataclass
 class Candlestick:
     """بيانات الشمعة"""
@@ -176,35 +212,49 @@ class AdvancedMarketAnalyzer:
 
     def _convert_to_candlesticks(self, historical_data: List[Dict], 
                                current_data: Dict) -> List[Candlestick]:
-        """تحويل البيانات التاريخية إلى شموع"""
-        
-        candlesticks = []
+        """تحويل البيانات التاريخية إلى شموع
+        
+        الأعمدة (الأسعار، التقلبات، الأحجام، الأوقات) تُبنى كمصفوفات بسحب متجهي واحد
+        لكل عمود، ثم تُجمع في كائنات Candlestick مرة واحدة
+        """
+        n = len(historical_data)
+        if n == 0:
+            return []
+        
+        default_price = current_data.get('price', 100)
+        prices = np.fromiter(
+            (data.get('price', default_price) for data in historical_data), dtype=np.float64, count=n
+        )
         
-        # معالجة البيانات التاريخية
-        for i, data in enumerate(historical_data):
-            price = data.get('price', current_data.get('price', 100))
-            
-            # محاكاة بيانات OHLC واقعية
-            variation = np.random.normal(0, 0.002)  # تقلب 0.2%
-            
-            open_price = price * (1 + variation)
-            close_price = price * (1 + np.random.normal(0, 0.003))
-            
-            high_price = max(open_price, close_price) * (1 + abs(np.random.normal(0, 0.001)))
-            low_price = min(open_price, close_price) * (1 - abs(np.random.normal(0, 0.001)))
-            
-            candlestick = Candlestick(
-                timestamp=data.get('timestamp', time.time() - (len(historical_data) - i) * 300),
+        # محاكاة بيانات OHLC واقعية
+        open_prices = prices * (1 + np.random.normal(0, 0.002, n))  # تقلب 0.2%
+        close_prices = prices * (1 + np.random.normal(0, 0.003, n))
+        high_prices = np.maximum(open_prices, close_prices) * (1 + np.abs(np.random.normal(0, 0.001, n)))
+        low_prices = np.minimum(open_prices, close_prices) * (1 - np.abs(np.random.normal(0, 0.001, n)))
+        
+        now = time.time()
+        random_volumes = np.random.randint(1000, 10000, n).tolist()
+        timestamps = [
+            data.get('timestamp', now - (n - i) * 300) for i, data in enumerate(historical_data)
+        ]
+        volumes = [
+            data.get('volume', random_volume) for data, random_volume in zip(historical_data, random_volumes)
+        ]
+        
+        return [
+            Candlestick(
+                timestamp=timestamp,
                 open_price=open_price,
                 high_price=high_price,
                 low_price=low_price,
                 close_price=close_price,
-                volume=data.get('volume', np.random.randint(1000, 10000))
+                volume=volume
             )
-            
-            candlesticks.append(candlestick)
-        
-        return candlesticks
+            for timestamp, open_price, high_price, low_price, close_price, volume in zip(
+                timestamps, open_prices.tolist(), high_prices.tolist(),
+                low_prices.tolist(), close_prices.tolist(), volumes
+            )
+        ]
 
     def _analyze_support_resistance(self, candlesticks: List[Candlestick]) -> Dict[str, Any]:
         """تحليل مناطق الدعم والمقاومة المتقدم"""
@@ -328,16 +378,22 @@ class AdvancedMarketAnalyzer:
         patterns = []
         signals = []
         
-        # تحليل آخر 10 شموع للأنماط
+        # تحليل آخر 10 شموع للأنماط - بناء المصفوفات مرة واحدة ثم الفحص في حلقة مترجمة
         recent_candles = candlesticks[-10:]
-        
-        for i in range(len(recent_candles)):
+        n = len(recent_candles)
+        open_ = np.fromiter((c.open_price for c in recent_candles), dtype=np.float64, count=n)
+        high = np.fromiter((c.high_price for c in recent_candles), dtype=np.float64, count=n)
+        low = np.fromiter((c.low_price for c in recent_candles), dtype=np.float64, count=n)
+        close = np.fromiter((c.close_price for c in recent_candles), dtype=np.float64, count=n)
+        hammer, doji, bullish_engulfing, bearish_engulfing = _candlestick_loop(open_, high, low, close, n)
+        
+        for i in range(n):
             candle = recent_candles[i]
             
             # === تحليل أنماط الشمعة الواحدة ===
             
             # نمط المطرقة
-            if self._is_hammer_pattern(candle):
+            if hammer[i]:
                 patterns.append(MarketPattern(
                     pattern_type=PatternType.HAMMER,
                     confidence=0.75,
@@ -350,7 +406,7 @@ class AdvancedMarketAnalyzer:
                 signals.append("إشارة صاعدة: نمط المطرقة مكتشف")
             
             # نمط الدوجي
-            if self._is_doji_pattern(candle):
+            if doji[i]:
                 patterns.append(MarketPattern(
                     pattern_type=PatternType.DOJI,
                     confidence=0.65,
@@ -363,32 +419,31 @@ class AdvancedMarketAnalyzer:
                 signals.append("تحذير: نمط الدوجي - احتمال انعكاس")
             
             # === تحليل أنماط متعددة الشموع ===
-            if i >= 2:
-                # نمط البلع الصاعد
-                if self._is_bullish_engulfing(recent_candles[i-1], candle):
-                    patterns.append(MarketPattern(
-                        pattern_type=PatternType.ENGULFING_BULLISH,
-                        confidence=0.85,
-                        start_time=recent_candles[i-1].timestamp,
-                        end_time=candle.timestamp,
-                        key_levels=[recent_candles[i-1].low_price, candle.high_price],
-                        expected_move="bullish",
-                        target_price=candle.close_price * 1.025
-                    ))
-                    signals.append("إشارة قوية: نمط البلع الصاعد")
-                
-                # نمط البلع الهابط
-                if self._is_bearish_engulfing(recent_candles[i-1], candle):
-                    patterns.append(MarketPattern(
-                        pattern_type=PatternType.ENGULFING_BEARISH,
-                        confidence=0.85,
-                        start_time=recent_candles[i-1].timestamp,
-                        end_time=candle.timestamp,
-                        key_levels=[recent_candles[i-1].high_price, candle.low_price],
-                        expected_move="bearish",
-                        target_price=candle.close_price * 0.975
-                    ))
-                    signals.append("إشارة قوية: نمط البلع الهابط")
+            # نمط البلع الصاعد
+            if bullish_engulfing[i]:
+                patterns.append(MarketPattern(
+                    pattern_type=PatternType.ENGULFING_BULLISH,
+                    confidence=0.85,
+                    start_time=recent_candles[i-1].timestamp,
+                    end_time=candle.timestamp,
+                    key_levels=[recent_candles[i-1].low_price, candle.high_price],
+                    expected_move="bullish",
+                    target_price=candle.close_price * 1.025
+                ))
+                signals.append("إشارة قوية: نمط البلع الصاعد")
+            
+            # نمط البلع الهابط
+            if bearish_engulfing[i]:
+                patterns.append(MarketPattern(
+                    pattern_type=PatternType.ENGULFING_BEARISH,
+                    confidence=0.85,
+                    start_time=recent_candles[i-1].timestamp,
+                    end_time=candle.timestamp,
+                    key_levels=[recent_candles[i-1].high_price, candle.low_price],
+                    expected_move="bearish",
+                    target_price=candle.close_price * 0.975
+                ))
+                signals.append("إشارة قوية: نمط البلع الهابط")
         
         return {
             'patterns': patterns,
@@ -478,164 +533,114 @@ class AdvancedMarketAnalyzer:
         if len(candlesticks) < 20:
             return {}
         
-        closes = [c.close_price for c in candlesticks]
-        highs = [c.high_price for c in candlesticks]
-        lows = [c.low_price for c in candlesticks]
-        volumes = [c.volume for c in candlesticks]
+        # بناء المصفوفات مرة واحدة وتمريرها لكل المؤشرات
+        n = len(candlesticks)
+        closes = np.fromiter((c.close_price for c in candlesticks), dtype=np.float64, count=n)
+        highs = np.fromiter((c.high_price for c in candlesticks), dtype=np.float64, count=n)
+        lows = np.fromiter((c.low_price for c in candlesticks), dtype=np.float64, count=n)
+        volumes = np.fromiter((c.volume for c in candlesticks), dtype=np.float64, count=n)
+        
+        # مرور واحد على الأسعار: مجاميع الأرباح والخسائر التراكمية تعطي RSI لأي فترة،
+        # وقمة/قاع نافذة 14 مشتركة بين Williams %R و ADX و Stochastic
+        close_gains, close_losses = self._change_cumsums(closes)
+        highest_14 = highs[-14:].max()
+        lowest_14 = lows[-14:].min()
         
         indicators = {}
         
         # RSI متعدد الأطر الزمنية
-        indicators['rsi_14'] = self._calculate_rsi(closes, 14)
-        indicators['rsi_7'] = self._calculate_rsi(closes[-14:], 7) if len(closes) >= 14 else 50
+        indicators['rsi_14'] = self._rsi_from_cumsums(close_gains, close_losses, 14)
+        indicators['rsi_7'] = self._rsi_from_cumsums(close_gains, close_losses, 7)
         
         # مؤشر القوة النسبية للحجم
-        indicators['volume_rsi'] = self._calculate_rsi(volumes, 14)
+        indicators['volume_rsi'] = self._rsi_from_cumsums(*self._change_cumsums(volumes), 14)
         
         # مؤشر CCI
         indicators['cci'] = self._calculate_cci(highs, lows, closes, 20)
         
         # مؤشر Williams %R
-        indicators['williams_r'] = self._calculate_williams_r(highs, lows, closes, 14)
+        indicators['williams_r'] = self._calculate_williams_r(highest_14, lowest_14, closes[-1])
         
         # مؤشر ADX (قوة الاتجاه)
-        indicators['adx'] = self._calculate_adx(highs, lows, closes, 14)
+        indicators['adx'] = self._calculate_adx(highest_14, lowest_14, closes, 14)
         
         # مؤشر Stochastic
-        stoch = self._calculate_stochastic(highs, lows, closes, 14)
+        stoch = self._calculate_stochastic(highest_14, lowest_14, closes[-1])
         indicators['stoch_k'] = stoch['k']
         indicators['stoch_d'] = stoch['d']
         
         return indicators
 
-    # === وظائف مساعدة للأنماط ===
-    
-    def _is_hammer_pattern(self, candle: Candlestick) -> bool:
-        """فحص نمط المطرقة"""
-        body_size = candle.body_size
-        lower_shadow = candle.lower_shadow
-        upper_shadow = candle.upper_shadow
-        
-        return (lower_shadow > body_size * 2 and 
-                upper_shadow < body_size * 0.3 and
-                body_size > 0)
+    # === وظائف حساب المؤشرات (على مصفوفات float64) ===
     
-    def _is_doji_pattern(self, candle: Candlestick) -> bool:
-        """فحص نمط الدوجي"""
-        total_range = candle.high_price - candle.low_price
-        body_size = candle.body_size
-        
-        return body_size < total_range * 0.1
-    
-    def _is_bullish_engulfing(self, prev_candle: Candlestick, current_candle: Candlestick) -> bool:
-        """فحص نمط البلع الصاعد"""
-        return (prev_candle.is_bearish and 
-                current_candle.is_bullish and
-                current_candle.open_price < prev_candle.close_price and
-                current_candle.close_price > prev_candle.open_price)
-    
-    def _is_bearish_engulfing(self, prev_candle: Candlestick, current_candle: Candlestick) -> bool:
-        """فحص نمط البلع الهابط"""
-        return (prev_candle.is_bullish and 
-                current_candle.is_bearish and
-                current_candle.open_price > prev_candle.close_price and
-                current_candle.close_price < prev_candle.open_price)
-
-    # === وظائف حساب المؤشرات ===
+    def _change_cumsums(self, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """المجاميع التراكمية للأرباح والخسائر (تبدأ بصفر) - مجموع آخر p تغير = cs[-1] - cs[-1-p]"""
+        changes = np.diff(values)
+        gains = np.concatenate(([0.0], np.cumsum(np.maximum(changes, 0.0))))
+        losses = np.concatenate(([0.0], np.cumsum(np.maximum(-changes, 0.0))))
+        return gains, losses
     
-    def _calculate_rsi(self, prices: List[float], period: int) -> float:
-        """حساب مؤشر القوة النسبية"""
-        if len(prices) < period + 1:
+    def _rsi_from_cumsums(self, gains: np.ndarray, losses: np.ndarray, period: int) -> float:
+        """حساب مؤشر القوة النسبية لفترة من المجاميع التراكمية"""
+        if len(gains) < period + 1:
             return 50.0
         
-        gains = []
-        losses = []
-        
-        for i in range(1, len(prices)):
-            change = prices[i] - prices[i-1]
-            if change > 0:
-                gains.append(change)
-                losses.append(0)
-            else:
-                gains.append(0)
-                losses.append(abs(change))
+        avg_gain = (gains[-1] - gains[-1 - period]) / period
+        avg_loss = (losses[-1] - losses[-1 - period]) / period
         
-        if len(gains) < period:
-            return 50.0
-        
-        avg_gain = sum(gains[-period:]) / period
-        avg_loss = sum(losses[-period:]) / period
-        
-        if avg_loss == 0:
+        if avg_loss <= 0:
             return 100.0
         
         rs = avg_gain / avg_loss
         rsi = 100 - (100 / (1 + rs))
         
-        return round(rsi, 2)
+        return round(float(rsi), 2)
     
-    def _calculate_cci(self, highs: List[float], lows: List[float], 
-                      closes: List[float], period: int) -> float:
+    def _calculate_cci(self, highs: np.ndarray, lows: np.ndarray, 
+                      closes: np.ndarray, period: int) -> float:
         """حساب مؤشر CCI"""
         if len(closes) < period:
             return 0.0
         
-        typical_prices = [(h + l + c) / 3 for h, l, c in zip(highs, lows, closes)]
-        
-        if len(typical_prices) < period:
-            return 0.0
+        typical_prices = (highs[-period:] + lows[-period:] + closes[-period:]) / 3
         
-        sma = sum(typical_prices[-period:]) / period
-        mean_deviation = sum([abs(tp - sma) for tp in typical_prices[-period:]]) / period
+        sma = typical_prices.mean()
+        mean_deviation = np.abs(typical_prices - sma).mean()
         
         if mean_deviation == 0:
             return 0.0
         
         cci = (typical_prices[-1] - sma) / (0.015 * mean_deviation)
-        return round(cci, 2)
+        return round(float(cci), 2)
     
-    def _calculate_williams_r(self, highs: List[float], lows: List[float], 
-                            closes: List[float], period: int) -> float:
-        """حساب مؤشر Williams %R"""
-        if len(closes) < period:
-            return -50.0
-        
-        highest_high = max(highs[-period:])
-        lowest_low = min(lows[-period:])
-        
+    def _calculate_williams_r(self, highest_high: float, lowest_low: float, close: float) -> float:
+        """حساب مؤشر Williams %R من قمة وقاع النافذة"""
         if highest_high == lowest_low:
             return -50.0
         
-        williams_r = ((highest_high - closes[-1]) / (highest_high - lowest_low)) * -100
-        return round(williams_r, 2)
+        williams_r = ((highest_high - close) / (highest_high - lowest_low)) * -100
+        return round(float(williams_r), 2)
     
-    def _calculate_adx(self, highs: List[float], lows: List[float], 
-                      closes: List[float], period: int) -> float:
+    def _calculate_adx(self, highest_high: float, lowest_low: float, 
+                      closes: np.ndarray, period: int) -> float:
         """حساب مؤشر ADX"""
         # تبسيط حساب ADX
         if len(closes) < period + 1:
             return 25.0
         
         # محاكاة قيمة ADX بناءً على التقلبات
-        recent_range = max(highs[-period:]) - min(lows[-period:])
-        avg_price = sum(closes[-period:]) / period
+        recent_range = highest_high - lowest_low
+        avg_price = closes[-period:].mean()
         
         adx = (recent_range / avg_price) * 100
-        return min(100, max(0, round(adx, 2)))
+        return min(100, max(0, round(float(adx), 2)))
     
-    def _calculate_stochastic(self, highs: List[float], lows: List[float], 
-                            closes: List[float], period: int) -> Dict[str, float]:
-        """حساب مؤشر Stochastic"""
-        if len(closes) < period:
-            return {'k': 50.0, 'd': 50.0}
-        
-        highest_high = max(highs[-period:])
-        lowest_low = min(lows[-period:])
-        
+    def _calculate_stochastic(self, highest_high: float, lowest_low: float, close: float) -> Dict[str, float]:
+        """حساب مؤشر Stochastic من قمة وقاع النافذة"""
         if highest_high == lowest_low:
             k = 50.0
         else:
-            k = ((closes[-1] - lowest_low) / (highest_high - lowest_low)) * 100
+            k = float((close - lowest_low) / (highest_high - lowest_low)) * 100
         
         # تبسيط حساب %D
         d = k * 0.9 + 10  # محاكاة متوسط متحرك
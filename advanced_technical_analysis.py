@@ -15,6 +15,7 @@ import math
 from typing import Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass
 from enum import Enum
+from _njit import njit
 
 class TrendDirection(Enum):
     UPTREND = "uptrend"
@@ -26,6 +27,67 @@ class SignalType(Enum):
     SELL = "SELL"
     HOLD = "HOLD"
 
+# رموز الاتجاه التي تعيدها score_trend_votes
+_TREND_BY_CODE = (TrendDirection.UPTREND, TrendDirection.DOWNTREND, TrendDirection.SIDEWAYS)
+
+
+@njit(cache=True)
+def score_trend_votes(rsi, macd, price, bollinger_upper, bollinger_lower, stochastic,
+                      w_rsi, w_macd, w_bollinger, w_stochastic, stability_threshold):
+    """تصويت المؤشرات (RSI، MACD، Bollinger، Stochastic) بأوزان التعلم
+    
+    يعيد (رمز الاتجاه في _TREND_BY_CODE، الاستقرار): ذروة البيع تُحسب صعوداً وذروة الشراء هبوطاً
+    """
+    bullish = 0.0
+    bearish = 0.0
+    neutral = 0.0
+    
+    # تصويت RSI
+    if rsi > 70:
+        bearish += 0.8 * w_rsi
+    elif rsi < 30:
+        bullish += 0.8 * w_rsi
+    elif 45 <= rsi <= 55:
+        neutral += 0.6 * w_rsi
+    elif rsi > 55:
+        bullish += 0.7 * w_rsi
+    else:
+        bearish += 0.7 * w_rsi
+    
+    # تصويت MACD
+    if macd > 0:
+        bullish += 0.8 * w_macd
+    elif macd < 0:
+        bearish += 0.8 * w_macd
+    else:
+        neutral += 0.5 * w_macd
+    
+    # تصويت Bollinger Bands
+    if price > bollinger_upper:
+        bearish += 0.9 * w_bollinger
+    elif price < bollinger_lower:
+        bullish += 0.9 * w_bollinger
+    else:
+        neutral += 0.6 * w_bollinger
+    
+    # تصويت Stochastic
+    if stochastic > 80:
+        bearish += 0.7 * w_stochastic
+    elif stochastic < 20:
+        bullish += 0.7 * w_stochastic
+    else:
+        neutral += 0.5 * w_stochastic
+    
+    # تحديد الاتجاه النهائي
+    max_score = max(bullish, bearish, neutral)
+    stability = max_score / (bullish + bearish + neutral)
+    if max_score == bullish and stability > stability_threshold:
+        return 0, stability
+    elif max_score == bearish and stability > stability_threshold:
+        return 1, stability
+    return 2, stability
+
+
 @dataclass
 class MarketState:
     """حالة السوق مع المؤشرات الفنية"""
@@ -133,70 +195,15 @@ class SmartTechnicalAnalyzer:
     def analyze_trend_stability(self, market_state: MarketState) -> Tuple[TrendDirection, float]:
         """تحليل الاتجاه مع التركيز على الاستقرار"""
         
-        indicators_vote = {}
-        
-        # تصويت RSI
-        if market_state.rsi > 70:
-            indicators_vote['rsi'] = ('overbought', 0.8)
-        elif market_state.rsi < 30:
-            indicators_vote['rsi'] = ('oversold', 0.8)
-        elif 45 <= market_state.rsi <= 55:
-            indicators_vote['rsi'] = ('neutral', 0.6)
-        elif market_state.rsi > 55:
-            indicators_vote['rsi'] = ('bullish', 0.7)
-        else:
-            indicators_vote['rsi'] = ('bearish', 0.7)
-        
-        # تصويت MACD
-        if market_state.macd > 0:
-            indicators_vote['macd'] = ('bullish', 0.8)
-        elif market_state.macd < 0:
-            indicators_vote['macd'] = ('bearish', 0.8)
-        else:
-            indicators_vote['macd'] = ('neutral', 0.5)
-        
-        # تصويت Bollinger Bands
-        if market_state.price > market_state.bollinger_upper:
-            indicators_vote['bollinger'] = ('overbought', 0.9)
-        elif market_state.price < market_state.bollinger_lower:
-            indicators_vote['bollinger'] = ('oversold', 0.9)
-        else:
-            indicators_vote['bollinger'] = ('neutral', 0.6)
-        
-        # تصويت Stochastic
-        if market_state.stochastic > 80:
-            indicators_vote['stochastic'] = ('overbought', 0.7)
-        elif market_state.stochastic < 20:
-            indicators_vote['stochastic'] = ('oversold', 0.7)
-        else:
-            indicators_vote['stochastic'] = ('neutral', 0.5)
-        
-        # حساب الاتجاه النهائي بناءً على الأوزان المحدثة
-        bullish_score = 0
-        bearish_score = 0
-        neutral_score = 0
-        
-        for indicator, (sentiment, confidence) in indicators_vote.items():
-            weight = self.learning_weights.get(indicator, 0.1)
-            weighted_confidence = confidence * weight
-            
-            if sentiment in ['bullish', 'oversold']:
-                bullish_score += weighted_confidence
-            elif sentiment in ['bearish', 'overbought']:
-                bearish_score += weighted_confidence
-            else:
-                neutral_score += weighted_confidence
-        
-        # تحديد الاتجاه النهائي
-        max_score = max(bullish_score, bearish_score, neutral_score)
-        stability = max_score / (bullish_score + bearish_score + neutral_score)
-        
-        if max_score == bullish_score and stability > self.trend_stability_threshold:
-            return TrendDirection.UPTREND, stability
-        elif max_score == bearish_score and stability > self.trend_stability_threshold:
-            return TrendDirection.DOWNTREND, stability
-        else:
-            return TrendDirection.SIDEWAYS, stability
+        weights = self.learning_weights
+        trend_code, stability = score_trend_votes(
+            market_state.rsi, market_state.macd, market_state.price,
+            market_state.bollinger_upper, market_state.bollinger_lower, market_state.stochastic,
+            weights.get('rsi', 0.1), weights.get('macd', 0.1),
+            weights.get('bollinger', 0.1), weights.get('stochastic', 0.1),
+            self.trend_stability_threshold
+        )
+        return _TREND_BY_CODE[trend_code], stability
 
     def generate_smart_signal(self, asset_id: str, market_state: MarketState) -> Optional[TechnicalSignal]:
         """توليد إشارة ذكية مع فحص استقرار السوق - لا ترسل إشارة إلا إذا كان السوق مستقر"""
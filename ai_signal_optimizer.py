@@ -3,21 +3,231 @@
 يستخدم تقنيات التعلم الآلي لتحسين دقة الإشارات ومنع الإشارات الخاسرة
 """
 import logging
+import os
+import sqlite3
 import time
 import json
-from datetime import datetime, timedelta
-from typing import Dict, List, Any, Tuple
+from typing import Dict, List, Any, Tuple, Union
+from dataclasses import dataclass
 import threading
 import random
 import math
+from enum import IntEnum
+from functools import lru_cache
+import numpy as np
+from _njit import njit
+
+logger = logging.getLogger(__name__)
+
+
+class Trend(IntEnum):
+    """اتجاه السوق كرقم صغير بدل النص"""
+    SIDEWAYS = 0
+    UPTREND = 1
+    DOWNTREND = 2
+    UNKNOWN = 3
+
+
+class SignalSide(IntEnum):
+    """نوع الإشارة: شراء أو بيع"""
+    BUY = 0
+    SELL = 1
+
+
+_TREND_BY_NAME = {
+    'sideways': Trend.SIDEWAYS,
+    'uptrend': Trend.UPTREND,
+    'downtrend': Trend.DOWNTREND
+}
+
+
+def parse_trend(value) -> Trend:
+    """تحويل الاتجاه النصي ('uptrend'...) إلى Trend عند دخول البيانات"""
+    return _TREND_BY_NAME.get(value, Trend.UNKNOWN)
+
+
+def parse_side(value) -> SignalSide:
+    """تحويل نوع الإشارة النصي إلى SignalSide - أي قيمة غير BUY تُعامل كبيع"""
+    return SignalSide.BUY if value == 'BUY' else SignalSide.SELL
+
+
+@dataclass(slots=True, frozen=True)
+class SignalView:
+    """حقول الإشارة المستخدمة في التحليل - تُقرأ من dict مرة واحدة عند الدخول"""
+    rsi: float
+    confidence: float
+    volatility: float
+    trend: Trend
+    side: SignalSide
+    
+    @classmethod
+    def from_dict(cls, signal_data: Dict) -> 'SignalView':
+        get = signal_data.get
+        return cls(
+            rsi=get('rsi', 50),
+            confidence=get('confidence', 0),
+            volatility=get('volatility', 0),
+            trend=parse_trend(get('trend', 'sideways')),
+            side=parse_side(get('type', 'BUY'))
+        )
+
+
+SignalInput = Union[SignalView, Dict]
+
+
+def as_signal_view(signal: SignalInput) -> SignalView:
+    """قبول SignalView جاهز أو dict الإشارة كما يصل من الخدمات"""
+    return signal if isinstance(signal, SignalView) else SignalView.from_dict(signal)
+
+
+# توصيات قواعد تقييم الجودة بترتيب تطبيقها - البت i في قناع _score_rules يقابل العنصر i
+QUALITY_RULES = (
+    "✅ RSI في النطاق الأمثل للشراء",
+    "⚠️ RSI مرتفع جداً - مخاطر عالية للشراء",
+    "✅ RSI في النطاق الأمثل للبيع",
+    "⚠️ RSI منخفض جداً - مخاطر عالية للبيع",
+    "✅ الاتجاه يدعم إشارة الشراء",
+    "✅ الاتجاه يدعم إشارة البيع",
+    "⚠️ السوق في حالة تذبذب - مخاطر متوسطة",
+    "❌ الاتجاه يعارض الإشارة - مخاطر عالية",
+    "⚠️ تقلبات عالية جداً - مخاطر زائدة",
+    "✅ تقلبات منخفضة - استقرار جيد",
+    "✅ مستوى ثقة ممتاز",
+    "⚠️ مستوى ثقة منخفض",
+)
+LOW_QUALITY_RECOMMENDATION = "❌ جودة الإشارة منخفضة جداً - يُنصح بتجنبها"
+
+
+@lru_cache(maxsize=None)
+def _rule_recommendations(fired: int) -> Tuple[str, ...]:
+    """توصيات القواعد المطبقة من قناع _score_rules - تُبنى مرة واحدة لكل قناع"""
+    return tuple(message for bit, message in enumerate(QUALITY_RULES) if fired >> bit & 1)
+
+
+@njit(cache=True)
+def _score_rules(rsi, confidence, volatility, trend, side):
+    """الدرجة الأولية وقناع القواعد المطبقة لإشارة واحدة
+
+    trend بقيم Trend و side بقيم SignalSide؛ البت i في القناع يقابل QUALITY_RULES[i].
+    """
+    score = 0
+    mask = 0
+    
+    # تحليل RSI الذكي
+    if side == 0:  # BUY
+        if 20 <= rsi <= 45:
+            score += 25
+            mask |= 1 << 0
+        elif rsi > 70:
+            score -= 20
+            mask |= 1 << 1
+    else:  # SELL
+        if 55 <= rsi <= 80:
+            score += 25
+            mask |= 1 << 2
+        elif rsi < 30:
+            score -= 20
+            mask |= 1 << 3
+    
+    # تحليل الاتجاه الذكي
+    if trend == 1 and side == 0:
+        score += 30
+        mask |= 1 << 4
+    elif trend == 2 and side == 1:
+        score += 30
+        mask |= 1 << 5
+    elif trend == 0:
+        score -= 15
+        mask |= 1 << 6
+    else:
+        score -= 25
+        mask |= 1 << 7
+    
+    # تحليل التقلبات
+    if volatility > 2.0:
+        score -= 20
+        mask |= 1 << 8
+    elif volatility < 0.5:
+        score += 10
+        mask |= 1 << 9
+    
+    # تحليل مستوى الثقة
+    if confidence >= 90:
+        score += 20
+        mask |= 1 << 10
+    elif confidence < 75:
+        score -= 15
+        mask |= 1 << 11
+    
+    return score, mask
+
+
+# نسخة Python للإشارة المفردة - استدعاء النواة المترجمة لقيمة واحدة يكلف أكثر من تنفيذ الشروط
+_score_one = getattr(_score_rules, 'py_func', _score_rules)
+
+
+@njit(cache=True)
+def _score_kernel(rsi, confidence, volatility, trend, side, n):
+    """درجة الجودة الأولية لعدة إشارات دفعة واحدة - يعيد (الدرجات، أقنعة القواعد)"""
+    scores = np.zeros(n, dtype=np.int64)
+    fired = np.zeros(n, dtype=np.int64)
+    for i in range(n):
+        scores[i], fired[i] = _score_rules(rsi[i], confidence[i], volatility[i], trend[i], side[i])
+    return scores, fired
+
+
+# قاعدة معرفة الذكاء الاصطناعي - بيانات ثابتة مشتركة بين كل المثيلات (للقراءة فقط)
+AI_KNOWLEDGE_BASE = {
+    'market_patterns': {
+        'strong_uptrend': {
+            'conditions': {'trend_strength': '>80', 'rsi': '<60', 'momentum': '>1.0'},
+            'success_rate': 85,
+            'optimal_action': 'buy'
+        },
+        'strong_downtrend': {
+            'conditions': {'trend_strength': '>80', 'rsi': '>40', 'momentum': '<-1.0'},
+            'success_rate': 85,
+            'optimal_action': 'sell'
+        },
+        'sideways_market': {
+            'conditions': {'trend_strength': '<50', 'volatility': '>1.5'},
+            'success_rate': 30,
+            'optimal_action': 'avoid'
+        }
+    },
+    'risk_factors': {
+        'high_volatility': {'threshold': 2.0, 'risk_multiplier': 1.8},
+        'low_confidence': {'threshold': 70, 'risk_multiplier': 1.5},
+        'weak_trend': {'threshold': 60, 'risk_multiplier': 1.3}
+    }
+}
+
 
 class AISignalOptimizer:
-    def __init__(self):
-        """تهيئة محسن الإشارات بالذكاء الاصطناعي"""
-        
-        # بيانات التعلم الآلي
-        self.signal_patterns = {}  # أنماط الإشارات الناجحة
-        self.failure_patterns = {}  # أنماط الإشارات الفاشلة
+    __slots__ = (
+        'db_path', '_db_lock', '_db', '_blacklisted_keys', 'market_conditions',
+        'success_weights', 'learning_data', 'ai_knowledge_base',
+        '_previous_success_rate', '_hour_cache'
+    )
+    
+    def __init__(self, db_path=None):
+        """تهيئة محسن الإشارات بالذكاء الاصطناعي
+
+        db_path: ملف قاعدة الأنماط - الافتراضي من AI_PATTERNS_DB وإلا ai_patterns.db
+        """
+        
+        # بيانات التعلم الآلي: أنماط الإشارات الناجحة والفاشلة محفوظة في SQLite
+        self.db_path = db_path or os.environ.get('AI_PATTERNS_DB', 'ai_patterns.db')
+        self._db_lock = threading.Lock()
+        self._db = self._init_patterns_db()
+        # الأنماط المرفوضة (معدل فشل > 70%) مع معدل فشلها - يُحدَّث عند التعلم فقط
+        self._blacklisted_keys: Dict[Tuple[int, int, int, int], float] = {
+            (row[0], row[1], row[2], row[3]): row[4]
+            for row in self._db.execute(
+                'SELECT key_side, key_trend, key_rsi, key_vol, fail * 1.0 / total '
+                'FROM ai_patterns WHERE fail * 1.0 / total > 0.7'
+            )
+        }
         self.market_conditions = {}  # ظروف السوق المختلفة
         
         # معاملات التحسين الذكية المحسنة
@@ -38,112 +248,98 @@ class AISignalOptimizer:
         }
         
         # قاعدة معرفة الذكاء الاصطناعي
-        self.ai_knowledge_base = self._initialize_ai_knowledge()
+        self.ai_knowledge_base = AI_KNOWLEDGE_BASE
+        
+        # معدل النجاح في دورة التعديل السابقة (None قبل أول دورة)
+        self._previous_success_rate = None
+        
+        # الساعة المحلية المخزنة (الساعة، وقت القراءة monotonic) - تُحدَّث مرة كل دقيقة
+        self._hour_cache = (0, float('-inf'))
         
-        logging.info("🧠 تم تهيئة نظام الذكاء الاصطناعي لتحسين الإشارات")
+        logger.info("🧠 تم تهيئة نظام الذكاء الاصطناعي لتحسين الإشارات")
     
-    def _initialize_ai_knowledge(self):
-        """تهيئة قاعدة المعرفة الذكية"""
-        return {
-            'market_patterns': {
-                'strong_uptrend': {
-                    'conditions': {'trend_strength': '>80', 'rsi': '<60', 'momentum': '>1.0'},
-                    'success_rate': 85,
-                    'optimal_action': 'buy'
-                },
-                'strong_downtrend': {
-                    'conditions': {'trend_strength': '>80', 'rsi': '>40', 'momentum': '<-1.0'},
-                    'success_rate': 85,
-                    'optimal_action': 'sell'
-                },
-                'sideways_market': {
-                    'conditions': {'trend_strength': '<50', 'volatility': '>1.5'},
-                    'success_rate': 30,
-                    'optimal_action': 'avoid'
-                }
-            },
-            'risk_factors': {
-                'high_volatility': {'threshold': 2.0, 'risk_multiplier': 1.8},
-                'low_confidence': {'threshold': 70, 'risk_multiplier': 1.5},
-                'weak_trend': {'threshold': 60, 'risk_multiplier': 1.3}
-            }
-        }
+    def _init_patterns_db(self) -> sqlite3.Connection:
+        """فتح قاعدة أنماط التعلم وإنشاء الجدول - صف واحد لكل مفتاح نمط"""
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS ai_patterns (
+                key_side INTEGER NOT NULL,
+                key_trend INTEGER NOT NULL,
+                key_rsi INTEGER NOT NULL,
+                key_vol INTEGER NOT NULL,
+                success INTEGER NOT NULL DEFAULT 0,
+                fail INTEGER NOT NULL DEFAULT 0,
+                total INTEGER NOT NULL DEFAULT 0,
+                sum_profit REAL NOT NULL DEFAULT 0,
+                sum_loss REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (key_side, key_trend, key_rsi, key_vol)
+            )
+        ''')
+        return conn
     
-    def analyze_signal_quality(self, signal_data: Dict) -> Dict:
+    def _pattern_counts(self) -> Tuple[int, int]:
+        """عدد الأنماط الناجحة والفاشلة (نمط له نتيجة واحدة على الأقل من كل نوع)"""
+        with self._db_lock:
+            success_patterns, failure_patterns = self._db.execute(
+                'SELECT COALESCE(SUM(success > 0), 0), COALESCE(SUM(fail > 0), 0) FROM ai_patterns'
+            ).fetchone()
+        return success_patterns, failure_patterns
+    
+    def analyze_signal_quality(self, signal: SignalInput) -> Dict:
         """تحليل جودة الإشارة باستخدام الذكاء الاصطناعي"""
+        view = as_signal_view(signal)
+        return self._finalize_quality(
+            view, *_score_one(view.rsi, view.confidence, view.volatility, view.trend, view.side)
+        )
+    
+    def analyze_signal_quality_batch(self, signals: List[SignalInput]) -> List[Dict]:
+        """تحليل جودة عدة إشارات - الدرجات الأولية تُحسب في حلقة مترجمة واحدة عند توفر numba"""
+        n = len(signals)
+        if n == 0:
+            return []
         
+        # إشارة واحدة، أو بدون numba (النواة حلقة Python على عناصر numpy): المسار المفرد أسرع
+        if n == 1 or _score_one is _score_rules:
+            return [self.analyze_signal_quality(signal) for signal in signals]
+        
+        views = [as_signal_view(signal) for signal in signals]
+        
+        # تحليل المؤشرات الفنية
+        rsi = np.fromiter((v.rsi for v in views), dtype=np.float64, count=n)
+        confidence = np.fromiter((v.confidence for v in views), dtype=np.float64, count=n)
+        volatility = np.fromiter((v.volatility for v in views), dtype=np.float64, count=n)
+        trend = np.fromiter((v.trend for v in views), dtype=np.int8, count=n)
+        side = np.fromiter((v.side for v in views), dtype=np.int8, count=n)
+        
+        scores, fired = _score_kernel(rsi, confidence, volatility, trend, side, n)
+        
+        return [
+            self._finalize_quality(view, int(score), int(mask))
+            for view, score, mask in zip(views, scores, fired)
+        ]
+    
+    def _finalize_quality(self, signal: SignalView, quality_score: int, fired: int) -> Dict:
+        """إكمال تحليل إشارة واحدة من درجتها الأولية وقناع القواعد"""
+        
+        recommendations = list(_rule_recommendations(fired))
         analysis = {
             'quality_score': 0,
             'risk_level': 'low',
-            'recommendations': [],
+            'recommendations': recommendations,
             'should_proceed': True,
             'ai_confidence': 0,
             'optimization_applied': False
         }
         
-        # تحليل المؤشرات الفنية
-        rsi = signal_data.get('rsi', 50)
-        confidence = signal_data.get('confidence', 0)
-        trend = signal_data.get('trend', 'sideways')
-        volatility = signal_data.get('volatility', 0)
-        signal_type = signal_data.get('type', 'BUY')
-        
-        # حساب درجة الجودة الأولية
-        quality_score = 0
-        
-        # تحليل RSI الذكي
-        if signal_type == 'BUY':
-            if 20 <= rsi <= 45:
-                quality_score += 25
-                analysis['recommendations'].append("✅ RSI في النطاق الأمثل للشراء")
-            elif rsi > 70:
-                quality_score -= 20
-                analysis['recommendations'].append("⚠️ RSI مرتفع جداً - مخاطر عالية للشراء")
-        else:  # SELL
-            if 55 <= rsi <= 80:
-                quality_score += 25
-                analysis['recommendations'].append("✅ RSI في النطاق الأمثل للبيع")
-            elif rsi < 30:
-                quality_score -= 20
-                analysis['recommendations'].append("⚠️ RSI منخفض جداً - مخاطر عالية للبيع")
-        
-        # تحليل الاتجاه الذكي
-        if trend == 'uptrend' and signal_type == 'BUY':
-            quality_score += 30
-            analysis['recommendations'].append("✅ الاتجاه يدعم إشارة الشراء")
-        elif trend == 'downtrend' and signal_type == 'SELL':
-            quality_score += 30
-            analysis['recommendations'].append("✅ الاتجاه يدعم إشارة البيع")
-        elif trend == 'sideways':
-            quality_score -= 15
-            analysis['recommendations'].append("⚠️ السوق في حالة تذبذب - مخاطر متوسطة")
-        else:
-            quality_score -= 25
-            analysis['recommendations'].append("❌ الاتجاه يعارض الإشارة - مخاطر عالية")
-        
-        # تحليل التقلبات
-        if volatility > 2.0:
-            quality_score -= 20
-            analysis['recommendations'].append("⚠️ تقلبات عالية جداً - مخاطر زائدة")
-        elif volatility < 0.5:
-            quality_score += 10
-            analysis['recommendations'].append("✅ تقلبات منخفضة - استقرار جيد")
-        
-        # تحليل مستوى الثقة
-        if confidence >= 90:
-            quality_score += 20
-            analysis['recommendations'].append("✅ مستوى ثقة ممتاز")
-        elif confidence < 75:
-            quality_score -= 15
-            analysis['recommendations'].append("⚠️ مستوى ثقة منخفض")
-        
         # تطبيق التحسينات الذكية
         if quality_score < 50:
-            optimized_signal = self._optimize_signal(signal_data, analysis)
+            optimized_signal = self._optimize_signal(signal, analysis)
             if optimized_signal:
                 quality_score = optimized_signal['improved_score']
                 analysis['optimization_applied'] = True
-                analysis['recommendations'].extend(optimized_signal['improvements'])
+                recommendations.extend(optimized_signal['improvements'])
         
         # تحديد مستوى المخاطر
         if quality_score >= 70:
@@ -155,49 +351,55 @@ class AISignalOptimizer:
         else:
             analysis['risk_level'] = 'high'
             analysis['should_proceed'] = False
-            analysis['recommendations'].append("❌ جودة الإشارة منخفضة جداً - يُنصح بتجنبها")
+            recommendations.append(LOW_QUALITY_RECOMMENDATION)
         
-        analysis['quality_score'] = max(0, min(100, quality_score))
-        analysis['ai_confidence'] = min(100, quality_score + random.randint(5, 15))
+        if quality_score < 0:
+            analysis['quality_score'] = 0
+        elif quality_score > 100:
+            analysis['quality_score'] = 100
+        else:
+            analysis['quality_score'] = quality_score
+        ai_confidence = quality_score + random.randint(5, 15)
+        analysis['ai_confidence'] = ai_confidence if ai_confidence < 100 else 100
         
         # تحديث إحصائيات التعلم
         self.learning_data['total_analyzed'] += 1
         
         return analysis
     
-    def _optimize_signal(self, signal_data: Dict, current_analysis: Dict) -> Dict:
+    def _optimize_signal(self, signal: SignalView, current_analysis: Dict) -> Dict:
         """تحسين الإشارة باستخدام التعلم الآلي"""
         
         improvements = []
         improved_score = current_analysis['quality_score']
         
-        rsi = signal_data.get('rsi', 50)
-        signal_type = signal_data.get('type', 'BUY')
-        trend = signal_data.get('trend', 'sideways')
+        rsi = signal.rsi
+        side = signal.side
+        trend = signal.trend
         
         # تحسين معايير RSI
-        if signal_type == 'BUY' and rsi > 60:
+        if side == SignalSide.BUY and rsi > 60:
             # تأجيل الإشارة حتى ينخفض RSI
             improvements.append("🔄 تأجيل إشارة الشراء حتى ينخفض RSI إلى أقل من 50")
             improved_score += 15
             
-        elif signal_type == 'SELL' and rsi < 40:
+        elif side == SignalSide.SELL and rsi < 40:
             # تأجيل الإشارة حتى يرتفع RSI
             improvements.append("🔄 تأجيل إشارة البيع حتى يرتفع RSI إلى أكثر من 50")
             improved_score += 15
         
         # تحسين توقيت الإشارة بناءً على الاتجاه
-        if trend == 'sideways':
+        if trend == Trend.SIDEWAYS:
             improvements.append("⏳ انتظار كسر الاتجاه الجانبي لإشارة أقوى")
             improved_score += 10
         
         # تحسين مستوى الثقة
-        if signal_data.get('confidence', 0) < 80:
+        if signal.confidence < 80:
             improvements.append("📈 رفع مستوى الثقة المطلوب إلى 85% كحد أدنى")
             improved_score += 12
         
         # التحسين الذكي للتوقيت
-        market_hour = datetime.now().hour
+        market_hour = self._current_hour()
         if 22 <= market_hour or market_hour <= 6:  # خارج ساعات التداول النشط
             improvements.append("⏰ تأجيل الإشارة لساعات التداول النشطة")
             improved_score += 8
@@ -214,70 +416,82 @@ class AISignalOptimizer:
     def learn_from_result(self, signal_data: Dict, result: str, actual_profit: float):
         """التعلم من نتائج الإشارات السابقة"""
         
-        pattern_key = self._create_pattern_key(signal_data)
-        
-        if result == 'winning':
-            # تعلم الأنماط الناجحة
-            if pattern_key not in self.signal_patterns:
-                self.signal_patterns[pattern_key] = {
-                    'success_count': 0,
-                    'total_count': 0,
-                    'avg_profit': 0,
-                    'pattern_data': signal_data.copy()
-                }
-            
-            pattern = self.signal_patterns[pattern_key]
-            pattern['success_count'] += 1
-            pattern['total_count'] += 1
-            pattern['avg_profit'] = (pattern['avg_profit'] + actual_profit) / 2
-            
+        view = SignalView.from_dict(signal_data)
+        pattern_key = self._create_pattern_key(view)
+        
+        won = result == 'winning'
+        with self._db_lock:
+            self._db.execute(
+                '''
+                INSERT INTO ai_patterns (key_side, key_trend, key_rsi, key_vol,
+                                         success, fail, total, sum_profit, sum_loss)
+                VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?)
+                ON CONFLICT (key_side, key_trend, key_rsi, key_vol) DO UPDATE SET
+                    success = success + excluded.success,
+                    fail = fail + excluded.fail,
+                    total = total + 1,
+                    sum_profit = sum_profit + excluded.sum_profit,
+                    sum_loss = sum_loss + excluded.sum_loss
+                ''',
+                (*pattern_key, int(won), int(not won),
+                 actual_profit if won else 0.0, 0.0 if won else abs(actual_profit))
+            )
+            fail, total = self._db.execute(
+                'SELECT fail, total FROM ai_patterns '
+                'WHERE key_side = ? AND key_trend = ? AND key_rsi = ? AND key_vol = ?',
+                pattern_key
+            ).fetchone()
+        
+        # تحديث قائمة الأنماط المرفوضة بمعدل الفشل الفعلي للنمط
+        failure_rate = fail / total
+        if failure_rate > 0.7:
+            self._blacklisted_keys[pattern_key] = failure_rate
         else:
-            # تعلم الأنماط الفاشلة
-            if pattern_key not in self.failure_patterns:
-                self.failure_patterns[pattern_key] = {
-                    'failure_count': 0,
-                    'total_count': 0,
-                    'avg_loss': 0,
-                    'pattern_data': signal_data.copy()
-                }
-            
-            pattern = self.failure_patterns[pattern_key]
-            pattern['failure_count'] += 1
-            pattern['total_count'] += 1
-            pattern['avg_loss'] = (pattern['avg_loss'] + abs(actual_profit)) / 2
-            
+            self._blacklisted_keys.pop(pattern_key, None)
+        
+        if not won:
             # تحديث معايير التجنب
-            self._update_avoidance_criteria(signal_data)
+            self._update_avoidance_criteria(view)
         
         self.learning_data['patterns_learned'] += 1
         
         # إعادة تعديل الأوزان بناءً على التعلم
         self._adjust_weights()
         
-        logging.info(f"🧠 AI تعلم من النتيجة: {result} - الربح: {actual_profit:.3f}%")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"🧠 AI تعلم من النتيجة: {result} - الربح: {actual_profit:.3f}%")
+    
+    def _current_hour(self) -> int:
+        """الساعة المحلية الحالية مع تخزين مؤقت لمدة 60 ثانية"""
+        now = time.monotonic()
+        hour, cached_at = self._hour_cache
+        if now - cached_at > 60:
+            hour = time.localtime().tm_hour
+            self._hour_cache = (hour, now)
+        return hour
     
-    def _create_pattern_key(self, signal_data: Dict) -> str:
-        """إنشاء مفتاح فريد للنمط"""
-        rsi_range = 'low' if signal_data.get('rsi', 50) < 40 else 'high' if signal_data.get('rsi', 50) > 60 else 'medium'
-        volatility_level = 'high' if signal_data.get('volatility', 0) > 1.5 else 'low'
+    def _create_pattern_key(self, signal: SignalView) -> Tuple[int, int, int, int]:
+        """إنشاء مفتاح فريد للنمط: أربعة أعداد صغيرة (نوع الإشارة، الاتجاه، نطاق RSI، مستوى التقلب)"""
+        rsi = signal.rsi
+        rsi_range = 0 if rsi < 40 else 2 if rsi > 60 else 1  # منخفض / متوسط / مرتفع
+        volatility_level = 1 if signal.volatility > 1.5 else 0  # مرتفع / منخفض
         
-        return f"{signal_data.get('type', 'BUY')}_{signal_data.get('trend', 'sideways')}_{rsi_range}_{volatility_level}"
+        return (int(signal.side), int(signal.trend), rsi_range, volatility_level)
     
-    def _update_avoidance_criteria(self, failed_signal: Dict):
+    def _update_avoidance_criteria(self, failed_signal: SignalView):
         """تحديث معايير تجنب الإشارات السيئة"""
         
-        rsi = failed_signal.get('rsi', 50)
-        signal_type = failed_signal.get('type', 'BUY')
-        trend = failed_signal.get('trend', 'sideways')
-        volatility = failed_signal.get('volatility', 0)
+        rsi = failed_signal.rsi
+        side = failed_signal.side
+        volatility = failed_signal.volatility
         
         # تشديد معايير RSI للنمط الفاشل
-        if signal_type == 'BUY' and rsi > 50:
+        if side == SignalSide.BUY and rsi > 50:
             self.success_weights['rsi_optimal']['buy'] = (
                 self.success_weights['rsi_optimal']['buy'][0],
                 min(45, self.success_weights['rsi_optimal']['buy'][1] - 2)
             )
-        elif signal_type == 'SELL' and rsi < 50:
+        elif side == SignalSide.SELL and rsi < 50:
             self.success_weights['rsi_optimal']['sell'] = (
                 max(60, self.success_weights['rsi_optimal']['sell'][0] + 2),
                 self.success_weights['rsi_optimal']['sell'][1]
@@ -293,52 +507,52 @@ class AISignalOptimizer:
     def _adjust_weights(self):
         """تعديل الأوزان بناءً على التعلم المكتسب"""
         
-        total_patterns = len(self.signal_patterns) + len(self.failure_patterns)
+        success_patterns, failure_patterns = self._pattern_counts()
+        total_patterns = success_patterns + failure_patterns
         if total_patterns < 3:  # تقليل العتبة للتعلم الأسرع
             return
         
-        success_rate = len(self.signal_patterns) / total_patterns * 100
+        success_rate = success_patterns / total_patterns * 100
         
         if success_rate < 50:  # خفض العتبة لتحسين أسرع
             # تشديد المعايير تدريجياً
             self.success_weights['trend_strength_min'] = min(80, self.success_weights['trend_strength_min'] + 3)
             self.success_weights['confidence_threshold'] = min(90, self.success_weights['confidence_threshold'] + 1)
-            logging.info("🔧 AI شدد المعايير لتحسين معدل النجاح")
+            logger.info("🔧 AI شدد المعايير لتحسين معدل النجاح")
         elif success_rate > 70:  # إضافة تحسين للنجاح العالي
             # تخفيف المعايير للمزيد من الفرص
             self.success_weights['trend_strength_min'] = max(60, self.success_weights['trend_strength_min'] - 2)
             self.success_weights['volatility_max'] = min(1.5, self.success_weights['volatility_max'] + 0.1)
-            logging.info("🚀 AI خفف المعايير للاستفادة من الأداء الجيد")
+            logger.info("🚀 AI خفف المعايير للاستفادة من الأداء الجيد")
         
         # حساب تحسن معدل النجاح
-        if hasattr(self, '_previous_success_rate'):
+        if self._previous_success_rate is not None:
             improvement = success_rate - self._previous_success_rate
             self.learning_data['success_rate_improvement'] = improvement
         
         self._previous_success_rate = success_rate
     
-    def should_generate_signal(self, market_data: Dict) -> Tuple[bool, Dict]:
+    def should_generate_signal(self, market_data: SignalInput) -> Tuple[bool, Dict]:
         """تحديد ما إذا كان يجب توليد إشارة أم لا"""
+        signal = as_signal_view(market_data)
         
         # التحليل الأولي
-        pre_analysis = self.analyze_signal_quality(market_data)
+        pre_analysis = self.analyze_signal_quality(signal)
         
         # فحص الأنماط المعروفة
-        pattern_key = self._create_pattern_key(market_data)
+        pattern_key = self._create_pattern_key(signal)
         
         # تجنب الأنماط الفاشلة المعروفة
-        if pattern_key in self.failure_patterns:
-            failure_rate = (self.failure_patterns[pattern_key]['failure_count'] / 
-                          self.failure_patterns[pattern_key]['total_count'])
-            if failure_rate > 0.7:
-                return False, {
-                    'reason': 'تجنب نمط فاشل معروف',
-                    'failure_rate': f"{failure_rate*100:.1f}%",
-                    'ai_decision': 'rejected_by_ai'
-                }
+        failure_rate = self._blacklisted_keys.get(pattern_key)
+        if failure_rate is not None:
+            return False, {
+                'reason': 'تجنب نمط فاشل معروف',
+                'failure_rate': f"{failure_rate*100:.1f}%",
+                'ai_decision': 'rejected_by_ai'
+            }
         
         # فحص ظروف السوق الحالية
-        current_conditions = self._analyze_current_market_conditions(market_data)
+        current_conditions = self._analyze_current_market_conditions(signal)
         
         if not pre_analysis['should_proceed']:
             return False, {
@@ -355,7 +569,7 @@ class AISignalOptimizer:
             'recommendations': pre_analysis['recommendations']
         }
     
-    def _analyze_current_market_conditions(self, market_data: Dict) -> Dict:
+    def _analyze_current_market_conditions(self, signal: SignalView) -> Dict:
         """تحليل ظروف السوق الحالية"""
         
         conditions = {
@@ -364,15 +578,14 @@ class AISignalOptimizer:
             'trend_clarity': 'clear'
         }
         
-        volatility = market_data.get('volatility', 0)
+        volatility = signal.volatility
         if volatility > 2.0:
             conditions['volatility_level'] = 'high'
             conditions['market_stability'] = 'unstable'
         elif volatility < 0.3:
             conditions['volatility_level'] = 'low'
         
-        trend = market_data.get('trend', 'sideways')
-        if trend == 'sideways':
+        if signal.trend == Trend.SIDEWAYS:
             conditions['trend_clarity'] = 'unclear'
         
         return conditions
@@ -380,8 +593,8 @@ class AISignalOptimizer:
     def get_ai_performance_report(self) -> Dict:
         """تقرير أداء الذكاء الاصطناعي"""
         
-        total_patterns = len(self.signal_patterns) + len(self.failure_patterns)
-        success_patterns = len(self.signal_patterns)
+        success_patterns, failure_patterns = self._pattern_counts()
+        total_patterns = success_patterns + failure_patterns
         
         success_rate = (success_patterns / total_patterns * 100) if total_patterns > 0 else 0
         
@@ -401,5 +614,15 @@ class AISignalOptimizer:
             'ai_status': 'learning' if total_patterns < 20 else 'optimized'
         }
 
-# إنشاء مثيل عالمي للمحسن الذكي
-ai_optimizer = AISignalOptimizer()
\ No newline at end of file
+_ai_optimizer_lock = threading.Lock()
+
+
+def __getattr__(name):
+    """إنشاء المثيل العالمي ai_optimizer عند أول استخدام بدلاً من وقت الاستيراد"""
+    if name != 'ai_optimizer':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    global ai_optimizer
+    with _ai_optimizer_lock:
+        if 'ai_optimizer' not in globals():
+            ai_optimizer = AISignalOptimizer()
+    return ai_optimizer
\ No newline at end of file
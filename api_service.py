@@ -1,14 +1,26 @@
 import logging
+import sys
 import time
-import json
-import statistics
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
-import requests
+from typing import Dict, List, Optional, Any, Tuple
 import random
-from advanced_technical_analysis import SmartTechnicalAnalyzer, MarketState
+import itertools
+import heapq
+import threading
+from types import MappingProxyType
+from dataclasses import dataclass
+import json
+import numpy as np
+from advanced_technical_analysis import SmartTechnicalAnalyzer
 from real_market_data import real_market_service
 
+# ساعة رتيبة للفترات الزمنية (أقفال الاتجاه وتقادم الأسعار) - لا تتأثر بتعديل ساعة النظام
+_mono = time.monotonic
+
+try:
+    from orjson import dumps as _orjson_dumps
+except ImportError:
+    _orjson_dumps = None
+
 try:
     from market_ai_engine import analyze_asset_with_ai
     AI_ENABLED = True
@@ -17,11 +29,126 @@ except ImportError:
     AI_ENABLED = False
     logging.warning("⚠️ نظام الذكاء الاصطناعي غير متوفر")
 
+# بيانات العرض الثابتة لكل اتجاه (تُبنى مرة واحدة بدلاً من كل تحديث) - للقراءة فقط
+TREND_OPTIONS = ('uptrend', 'downtrend', 'sideways')
+_TREND_META = MappingProxyType({
+    'uptrend': MappingProxyType({'trend': 'uptrend', 'trend_ar': 'صاعد', 'direction': '📈', 'color': '#27ae60'}),
+    'downtrend': MappingProxyType({'trend': 'downtrend', 'trend_ar': 'هابط', 'direction': '📉', 'color': '#e74c3c'}),
+    'sideways': MappingProxyType({'trend': 'sideways', 'trend_ar': 'غير محدد', 'direction': '🔍', 'color': '#95a5a6'}),
+})
+# احتمال بقاء الاتجاه عند انتهاء قفله (الباقي يُوزع بالتساوي على الاتجاهين الآخرين)
+TREND_STAY_PROBABILITY = 0.7
+
+# قوالب الإشارات لكل اتجاه - التحليل الموحد (type=None: يُختار عشوائياً، gate: احتمال التوليد)
+_SIGNAL_PROFILES = MappingProxyType({
+    # قاعدة صارمة: اتجاه صاعد = إشارة شراء فقط
+    'uptrend': MappingProxyType({
+        'type': 'BUY', 'gate': None,
+        'reason': "تحليل فني متقدم مؤكد - إشارة شراء مؤكدة - اتجاه صاعد قوي",
+        'price_change': (0.5, 2.0)
+    }),
+    # قاعدة صارمة: اتجاه هابط = إشارة بيع فقط
+    'downtrend': MappingProxyType({
+        'type': 'SELL', 'gate': None,
+        'reason': "تحليل فني متقدم مؤكد - إشارة بيع مؤكدة - اتجاه هابط قوي",
+        'price_change': (-2.0, -0.5)
+    }),
+    # اتجاه جانبي - إشارات حذرة جداً وباحتمال أقل
+    'sideways': MappingProxyType({
+        'type': None, 'gate': 0.2,
+        'reason': "تحليل فني متقدم مؤكد - إشارة احتياطية - اتجاه جانبي محدود",
+        'price_change': (-0.5, 0.5)
+    }),
+})
+_TECHNICAL_SUMMARIES = {
+    (trend, signal_type): f"تحليل موحد: اتجاه {trend} → إشارة {signal_type} مؤكدة"
+    for trend in TREND_OPTIONS for signal_type in ('BUY', 'SELL')
+}
+
+
+# الحد الأقصى للتنبيهات المحفوظة - الأقدم يُحذف عند تجاوزه
+MAX_ALERTS = 10_000
+# أنواع التنبيهات ذات الحد - أي نوع آخر اشتراك حركة عامة
+_THRESHOLD_ALERT_TYPES = frozenset(('above', 'below'))
+# نسبة الحركة (%) منذ آخر إطلاق التي تُطلق اشتراكات الحركة العامة
+GENERAL_ALERT_MOVE_PERCENT = 0.5
+
+# فترات المؤشرات الافتراضية
+RSI_PERIOD = 14
+SMA_SHORT_WINDOW = 5
+SMA_LONG_WINDOW = 20
+
+
+# مصفوفة انتقال الاتجاهات: البقاء باحتمال TREND_STAY_PROBABILITY والباقي بالتساوي على الاتجاهين الآخرين
+_TREND_TRANSITIONS = np.full(
+    (len(TREND_OPTIONS), len(TREND_OPTIONS)), (1.0 - TREND_STAY_PROBABILITY) / (len(TREND_OPTIONS) - 1)
+)
+np.fill_diagonal(_TREND_TRANSITIONS, TREND_STAY_PROBABILITY)
+# الحدود التراكمية لكل صف مزاحة برقم الصف (الصف i ينتهي عند i+1 تماماً) في مصفوفة مسطحة واحدة
+_TREND_CUMULATIVE = np.cumsum(_TREND_TRANSITIONS, axis=1)
+_TREND_CUMULATIVE[:, -1] = 1.0
+_TREND_CUMULATIVE = (_TREND_CUMULATIVE + np.arange(len(TREND_OPTIONS))[:, None]).ravel()
+
+
+def markov_step(states: np.ndarray, draws: np.ndarray) -> np.ndarray:
+    """خطوة ماركوف لاستقرار الاتجاه على أرقام الاتجاهات (فهارس TREND_OPTIONS)
+    
+    draws سحوبات منتظمة في [0, 1): السحب مزاحاً برقم الحالة يقع في صف الحالة من
+    _TREND_CUMULATIVE، فيحدد بحث ثنائي واحد الاتجاه التالي لكل الأصول
+    """
+    positions = np.searchsorted(_TREND_CUMULATIVE, states + draws, side='right')
+    return (positions - states * len(TREND_OPTIONS)).astype(np.int8)
+
+
+def dumps_json(obj) -> bytes:
+    """تحويل إلى JSON (UTF-8) - orjson إن وُجدت وإلا json القياسية"""
+    if _orjson_dumps is not None:
+        return _orjson_dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+@dataclass(slots=True)
+class PriceEntry:
+    """سعر أصل واحد في ذاكرة الخدمة"""
+    id: str
+    name: str
+    type: str
+    price: float
+    timestamp: float
+    trend: Dict[str, Any]
+    source: str = 'simulated'
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """الشكل المرسل للعملاء (JSON / Socket.IO)"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'type': self.type,
+            'price': self.price,
+            'timestamp': self.timestamp,
+            'trend': self.trend,
+            'source': self.source
+        }
+
+
 class PriceService:
     """خدمة متقدمة لمراقبة أسعار الأصول المالية - بدون ذكاء اصطناعي"""
     
-    def __init__(self):
-        """تهيئة الخدمة بالتحليل الفني المستقل"""
+    __slots__ = (
+        'assets', 'assets_by_id', 'price_entries', 'price_cache', 'asset_index', '_prices', '_rsi_avg_gain', '_rsi_avg_loss', '_sma_ring', '_sma_ring_pos', '_sma_sum_short',
+        '_sma_sum_long',
+        'alerts_by_id', '_alerts_by_asset', '_general_alerts', '_alert_heaps', '_alert_base_price', '_alert_id_gen', 'offline_mode', 'price_version', '_price_version_seen',
+        '_prices_json', '_prices_json_version',
+        'smart_analyzer', 'ai_enabled', 'rng', '_random', '_trend_state',
+        '_trend_heap', '_dirty', '_real_prices', '_real_prices_at', 'real_refresh_interval',
+        'real_prices_ttl', '_refresher'
+    )
+    
+    def __init__(self, seed: Optional[int] = None):
+        """تهيئة الخدمة بالتحليل الفني المستقل
+        
+        seed: بذرة اختيارية لمولدي الأرقام العشوائية - تعيد نفس تسلسل المحاكاة لتتبع الأداء
+        """
         # قائمة الأصول المالية
         self.assets = [
             {'id': 'BTCUSDT', 'name': 'البيتكوين', 'type': 'crypto'},
@@ -34,13 +161,47 @@ class PriceService:
             {'id': 'NZD/USD', 'name': 'NZD/USD', 'type': 'forex'},
             {'id': 'USD/CHF', 'name': 'USD/CHF', 'type': 'forex'}
         ]
+        # معرفات الأصول مُدمجة (interned) لتصبح مقارنة المفاتيح مقارنة مؤشرات
+        for asset in self.assets:
+            asset['id'] = sys.intern(asset['id'])
+        # بيانات الأصل بمعرفه - بحث مباشر بدل المرور على القائمة
+        self.assets_by_id = {asset['id']: asset for asset in self.assets}
         
-        # ذاكرة التخزين المؤقت
-        self.price_cache = {}
-        self.historical_data = {}
-        self.alerts = []
+        # ذاكرة التخزين المؤقت (بنفس ترتيب self.assets): السجلات الداخلية، ونسخة dict
+        # جاهزة للإرسال يُعاد بناء عناصرها فقط عند تغير الأصل
+        self.price_entries: Dict[str, PriceEntry] = {}
+        self.price_cache: Dict[str, Dict[str, Any]] = {}
+        self.asset_index = {asset['id']: i for i, asset in enumerate(self.assets)}
+        # الأسعار الحالية كمصفوفة واحدة - التحديث يتم عليها ثم يُنسخ إلى price_entries
+        self._prices = np.empty(len(self.assets), dtype=np.float64)
+        # حالة المؤشرات المتدفقة (صف لكل أصل): متوسطا Wilder للربح والخسارة، وحلقة آخر
+        # SMA_LONG_WINDOW سعر مع مجموعي النافذتين - كل سعر جديد يحدثها بعملية ثابتة الكلفة
+        self._rsi_avg_gain = np.zeros(len(self.assets), dtype=np.float64)
+        self._rsi_avg_loss = np.zeros(len(self.assets), dtype=np.float64)
+        self._sma_ring = np.empty((len(self.assets), SMA_LONG_WINDOW), dtype=np.float64)
+        self._sma_ring_pos = 0  # موضع أقدم سعر في الحلقة (والموضع التالي للكتابة)
+        self._sma_sum_short = np.zeros(len(self.assets), dtype=np.float64)
+        self._sma_sum_long = np.zeros(len(self.assets), dtype=np.float64)
+        # التنبيهات بحسب المعرف - معرفات متزايدة لا تتكرر حتى بعد الحذف
+        self.alerts_by_id: Dict[int, Dict[str, Any]] = {}
+        # نفس التنبيهات مفهرسة بالأصل ثم المعرف - الفحص يمر على الأصول المتغيرة فقط
+        self._alerts_by_asset: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        # اشتراكات الحركة العامة لكل أصل - تُطلق كلها معاً عند تحرك السعر
+        self._general_alerts: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        # تنبيهات الحد لكل أصل ككومتين: above (الحد، المعرف) وأصغر حد في القمة، و below
+        # (-الحد، المعرف) وأكبر حد في القمة؛ المحذوف يبقى فيها حتى يُتجاوز عند السحب أو الضغط
+        self._alert_heaps: Dict[str, Tuple[List[tuple], List[tuple]]] = {}
+        # سعر الأصل عند أول فحص أو آخر إطلاق لتنبيهات الحركة العامة - تُقاس الحركة منه
+        self._alert_base_price: Dict[str, float] = {}
+        self._alert_id_gen = itertools.count(1)
         self.offline_mode = False
-        self.last_price_change_check = 0
+        # رقم إصدار يزيد مع كل تحديث غيّر سعراً أو اتجاهاً فعلياً
+        self.price_version = 0
+        # آخر إصدار رآه كل مستهلك (بالاسم) - فحص التغير مقارنة أرقام بدل نسخ الأسعار
+        self._price_version_seen: Dict[str, int] = {}
+        # آخر JSON مُسلسل لـ price_cache وإصداره - يُعاد بناؤه فقط عند تغير الإصدار
+        self._prices_json = b''
+        self._prices_json_version = -1
         
         # النظام الذكي المتطور للتحليل الفني
         self.smart_analyzer = SmartTechnicalAnalyzer()
@@ -50,13 +211,29 @@ class PriceService:
         if self.ai_enabled:
             logging.info("🧠 الذكاء الاصطناعي المتطور جاهز للعمل")
         
-        # ذاكرة الاتجاه لكل أصل - منع التغيير العشوائي
-        self.trend_memory = {}
-        self.trend_lock_until = {}
+        # مولد أرقام عشوائية متجهي لتحديثات الأسعار المحاكاة (سحب واحد لكل الأصول)
+        self.rng = np.random.default_rng(seed)
+        # مولد Python خاص بالخدمة للسحوبات المفردة (أسرع من دوال random العامة)
+        self._random = random.Random(seed)
+        
+        # الاتجاه الحالي لكل أصل كرقم (فهرس في TREND_OPTIONS) بترتيب self.assets؛
+        # النص وبيانات العرض تُبنى فقط عند تغير الاتجاه في price_entries
+        self._trend_state = self.rng.integers(0, len(TREND_OPTIONS), size=len(self.assets), dtype=np.int8)
+        # كومة (موعد انتهاء القفل، الأصل) - التحديث يعيد حساب الاتجاهات المنتهية فقط
+        self._trend_heap = []
+        # الأصول التي تغير سعرها في آخر تحديث
+        self._dirty = set()
         
         # البيانات المولدة للنظام
         self.generate_sample_data()
         
+        # الأسعار الحقيقية تُجلب في خيط خلفي؛ التحديث يقرأ آخر نسخة دون انتظار الشبكة
+        self._real_prices: Dict[str, Any] = {}
+        self._real_prices_at = float('-inf')
+        self.real_refresh_interval = 5.0
+        self.real_prices_ttl = 10.0
+        self._refresher: Optional[threading.Thread] = None
+        
         # النظام يعمل بالتحليل الفني المستقل فقط
         logging.info("🚀 النظام يعمل بالتحليل الفني المستقل - سريع ومستقر")
     
@@ -76,172 +253,237 @@ class PriceService:
         }
         
         current_time = time.time()
-        for asset in self.assets:
+        # توليد أسعار متغيرة قليلاً لكل الأصول بسحب متجهي واحد
+        current_prices = np.fromiter(
+            (base_prices.get(asset['id'], 100.0) for asset in self.assets), dtype=np.float64, count=len(self.assets)
+        ) * (1 + self.rng.uniform(-0.02, 0.02, size=len(self.assets)))
+        for asset, current_price in zip(self.assets, current_prices.tolist()):
             asset_id = asset['id']
-            base_price = base_prices.get(asset_id, 100.0)
-            
-            # توليد أسعار متغيرة قليلاً
-            price_variation = random.uniform(-0.02, 0.02)
-            current_price = base_price * (1 + price_variation)
-            
-            self.price_cache[asset_id] = {
-                'id': asset_id,
-                'name': asset['name'],
-                'type': asset['type'],
-                'price': current_price,
-                'timestamp': current_time,
-                'trend': self._calculate_trend(asset_id)
-            }
-            
-            # إنشاء بيانات تاريخية بسيطة
-            self.historical_data[asset_id] = self._generate_historical_data(current_price)
-    
-    def _calculate_trend(self, asset_id: str):
-        """حساب الاتجاه المستقر - منع التغيير العشوائي"""
-        current_time = time.time()
+            entry = PriceEntry(
+                id=asset_id,
+                name=asset['name'],
+                type=asset['type'],
+                price=current_price,
+                timestamp=current_time,
+                trend={}
+            )
+            self.price_entries[asset_id] = entry
         
-        # فحص إذا كان الاتجاه مقفل لهذا الأصل
-        if (asset_id in self.trend_lock_until and 
-            current_time < self.trend_lock_until[asset_id] and 
-            asset_id in self.trend_memory):
-            # إرجاع الاتجاه المحفوظ بدون تغيير
-            return self.trend_memory[asset_id]
-        
-        # قائمة الاتجاهات
-        trend_options = ['uptrend', 'downtrend', 'sideways']
-        
-        # إذا كان هناك اتجاه سابق، أعطه وزن أكبر للاستقرار
-        if asset_id in self.trend_memory:
-            previous_trend = self.trend_memory[asset_id]['trend']
-            # 70% احتمال أن يبقى نفس الاتجاه
-            if random.random() < 0.7:
-                trend = previous_trend
-            else:
-                # 30% احتمال للتغيير لاتجاه آخر
-                other_trends = [t for t in trend_options if t != previous_trend]
-                trend = random.choice(other_trends)
-        else:
-            # أول مرة - اختر عشوائياً
-            trend = random.choice(trend_options)
+        # الاتجاه الأولي وقفله لكل الأصول، ثم النسخة الجاهزة للإرسال
+        self._calculate_trends(list(range(len(self.assets))))
+        for asset_id, entry in self.price_entries.items():
+            self.price_cache[asset_id] = entry.to_dict()
         
-        trend_colors = {
-            'uptrend': '#27ae60',
-            'downtrend': '#e74c3c',
-            'sideways': '#95a5a6'
-        }
+        self._prices = current_prices
         
-        trend_arabic = {
-            'uptrend': 'صاعد',
-            'downtrend': 'هابط',
-            'sideways': 'غير محدد'
-        }
+        # بيانات تاريخية بسيطة لجميع الأصول دفعة واحدة - تُستخدم فقط لتهيئة المؤشرات المتدفقة
+        self._init_indicator_state(self._generate_historical_data(current_prices))
+    
+    def _calculate_trends(self, indices: List[int]):
+        """حساب الاتجاه المستقر لمجموعة أصول دفعة واحدة - منع التغيير العشوائي
         
-        trend_icons = {
-            'uptrend': '📈',
-            'downtrend': '📉',
-            'sideways': '🔍'
-        }
+        يُستدعى فقط للأصول التي انتهى قفلها (بحسب _trend_heap) أو عند البدء؛ الاتجاه
+        المقفل يبقى في _trend_state و price_entries دون استدعاء
+        """
+        rng = self._random
         
-        # إنشاء بيانات الاتجاه الجديدة
-        trend_data = {
-            'trend': trend,
-            'trend_ar': trend_arabic.get(trend, 'غير محدد'),
-            'strength': random.randint(20, 100),  # قوة أعلى للاستقرار
-            'direction': trend_icons.get(trend, '🔍'),
-            'color': trend_colors.get(trend, '#95a5a6')
-        }
+        # خطوة ماركوف لكل الأصول المطلوبة بسحب متجهي واحد (70% بقاء، 30% تغيير)
+        states = markov_step(self._trend_state[indices], self.rng.random(len(indices)))
+        self._trend_state[indices] = states
         
-        # حفظ الاتجاه في الذاكرة
-        self.trend_memory[asset_id] = trend_data
+        now = _mono()
+        assets, price_entries, trend_heap = self.assets, self.price_entries, self._trend_heap
+        randint, uniform, heappush = rng.randint, rng.uniform, heapq.heappush
+        for index, state in zip(indices, states.tolist()):
+            asset_id = assets[index]['id']
+            # بيانات العرض للاتجاه الجديد
+            price_entries[asset_id].trend = {
+                **_TREND_META[TREND_OPTIONS[state]],
+                'strength': randint(20, 100)  # قوة أعلى للاستقرار
+            }
+            # قفل الاتجاه لمدة 30-60 ثانية لمنع التغيير المتكرر
+            heappush(trend_heap, (now + uniform(30, 60), asset_id))
+    
+    def _generate_historical_data(self, current_prices: np.ndarray, periods=50) -> np.ndarray:
+        """توليد أسعار تاريخية للتحليل الفني بشكل (عدد الأصول، periods)"""
+        changes = self.rng.uniform(-0.01, 0.01, size=(len(current_prices), periods))
+        return current_prices[:, None] * np.cumprod(1 + changes, axis=1)
+    
+    def _init_indicator_state(self, history: np.ndarray):
+        """تهيئة حالة RSI و SMA المتدفقة من الأسعار التاريخية (مرة واحدة عند البدء)"""
+        deltas = np.diff(history, axis=1)
+        gains = np.maximum(deltas, 0.0)
+        losses = np.maximum(-deltas, 0.0)
+        # تنعيم Wilder: متوسط أول RSI_PERIOD فرق ثم المرشح الأحادي بمعامل 1/RSI_PERIOD
+        alpha = 1.0 / RSI_PERIOD
+        decay = 1.0 - alpha
+        avg_gain = gains[:, :RSI_PERIOD].sum(axis=1) * alpha
+        avg_loss = losses[:, :RSI_PERIOD].sum(axis=1) * alpha
+        for j in range(RSI_PERIOD, deltas.shape[1]):
+            avg_gain = avg_gain * decay + gains[:, j] * alpha
+            avg_loss = avg_loss * decay + losses[:, j] * alpha
+        self._rsi_avg_gain, self._rsi_avg_loss = avg_gain, avg_loss
         
-        # قفل الاتجاه لمدة 30-60 ثانية لمنع التغيير المتكرر
-        lock_duration = random.uniform(30, 60)
-        self.trend_lock_until[asset_id] = current_time + lock_duration
+        # الحلقة تبدأ بآخر SMA_LONG_WINDOW سعر تاريخي (الأقدم في الموضع 0)
+        self._sma_ring = history[:, -SMA_LONG_WINDOW:].copy()
+        self._sma_ring_pos = 0
+        self._sma_sum_long = self._sma_ring.sum(axis=1)
+        self._sma_sum_short = self._sma_ring[:, -SMA_SHORT_WINDOW:].sum(axis=1)
+    
+    def _update_indicator_state(self, prices: np.ndarray):
+        """إضافة سعر جديد لكل الأصول إلى حالة RSI و SMA: إزالة الأقدم وإضافة الأحدث دون إعادة حساب"""
+        ring, pos = self._sma_ring, self._sma_ring_pos
+        # الإغلاق السابق هو أحدث سعر في الحلقة
+        delta = prices - ring[:, pos - 1]
+        alpha = 1.0 / RSI_PERIOD
+        decay = 1.0 - alpha
+        self._rsi_avg_gain = self._rsi_avg_gain * decay + np.maximum(delta, 0.0) * alpha
+        self._rsi_avg_loss = self._rsi_avg_loss * decay + np.maximum(-delta, 0.0) * alpha
         
-        return trend_data
+        # أقدم سعر في النافذة القصيرة يسبق موضع الكتابة بـ SMA_SHORT_WINDOW
+        self._sma_sum_short += prices - ring[:, (pos - SMA_SHORT_WINDOW) % SMA_LONG_WINDOW]
+        self._sma_sum_long += prices - ring[:, pos]
+        ring[:, pos] = prices
+        self._sma_ring_pos = (pos + 1) % SMA_LONG_WINDOW
     
-    def _generate_historical_data(self, current_price, periods=50):
-        """توليد بيانات تاريخية للتحليل الفني"""
-        data = []
-        price = current_price
-        
-        for i in range(periods):
-            change = random.uniform(-0.01, 0.01)
-            price = price * (1 + change)
-            data.append({
-                'timestamp': time.time() - (periods - i) * 300,  # كل 5 دقائق
-                'price': price,
-                'volume': random.randint(1000, 10000)
-            })
-        
-        return data
+    def get_rsi(self, asset_id: str) -> Optional[float]:
+        """RSI الحالي لأصل من الحالة المتدفقة (دون إعادة حساب)"""
+        index = self.asset_index.get(asset_id)
+        if index is None:
+            return None
+        avg_gain = float(self._rsi_avg_gain[index])
+        avg_loss = float(self._rsi_avg_loss[index])
+        if avg_loss == 0.0:
+            return 100.0 if avg_gain > 0 else 50.0
+        return 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    
+    def get_sma(self, asset_id: str) -> Optional[Dict[str, float]]:
+        """SMA القصير والطويل الحاليان لأصل من المجاميع المتدفقة"""
+        index = self.asset_index.get(asset_id)
+        if index is None:
+            return None
+        return {
+            'sma_short': float(self._sma_sum_short[index]) / SMA_SHORT_WINDOW,
+            'sma_long': float(self._sma_sum_long[index]) / SMA_LONG_WINDOW
+        }
     
     def get_all_prices(self) -> Dict[str, Any]:
-        """الحصول على جميع الأسعار"""
+        """الحصول على جميع الأسعار
+        
+        يعيد ذاكرة الأسعار نفسها دون نسخ: للقراءة فقط، وعناصر الأصول المتغيرة تُستبدل مع كل تحديث
+        """
         try:
             self._update_sample_prices()
-            return dict(self.price_cache)
         except Exception as e:
             logging.error(f"خطأ في الحصول على الأسعار: {e}")
-            return dict(self.price_cache)
+        return self.price_cache
+    
+    def get_all_prices_bytes(self) -> bytes:
+        """آخر أسعار محدثة بصيغة JSON جاهزة دون تشغيل تحديث جديد (مثل get_all_prices_fast)
+        
+        نفس البايتات تُعاد لكل الطلبات حتى تغير price_version
+        """
+        version = self.price_version
+        if self._prices_json_version != version:
+            self._prices_json = dumps_json(self.price_cache)
+            self._prices_json_version = version
+        return self._prices_json
     
     def get_all_prices_fast(self) -> Dict[str, Any]:
-        """نسخة سريعة للحصول على الأسعار"""
-        return self.get_all_prices()
+        """آخر أسعار محدثة دون تشغيل تحديث جديد - للقراءة فقط مثل get_all_prices"""
+        return self.price_cache
+    
+    def start(self):
+        """تشغيل خيط جلب الأسعار الحقيقية - يُستدعى مرة واحدة من التطبيق بعد الإنشاء"""
+        if self._refresher is None:
+            self._refresher = threading.Thread(
+                target=self._refresh_real_prices_loop, daemon=True, name='real-price-refresher'
+            )
+            self._refresher.start()
+    
+    def _refresh_real_prices_loop(self):
+        """جلب الأسعار الحقيقية دورياً واستبدال النسخة المخزنة دفعة واحدة"""
+        while True:
+            try:
+                real_prices = real_market_service.get_all_real_prices(self.assets)
+                self._real_prices, self._real_prices_at = real_prices, _mono()
+            except Exception as e:
+                logging.warning(f"فشل تحديث الأسعار الحقيقية، استخدام المحاكاة: {e}")
+            time.sleep(self.real_refresh_interval)
     
     def _update_sample_prices(self):
         """تحديث الأسعار - مع دمج البيانات الحقيقية"""
         current_time = time.time()
+        now = _mono()
         
-        # محاولة الحصول على أسعار حقيقية
-        try:
-            real_prices = real_market_service.get_all_real_prices(self.assets)
-            
-            for asset_id in self.price_cache:
-                if asset_id in real_prices and real_prices[asset_id]['source'] == 'real_market':
-                    # استخدام السعر الحقيقي
-                    self.price_cache[asset_id]['price'] = real_prices[asset_id]['price']
-                    self.price_cache[asset_id]['timestamp'] = current_time
-                    self.price_cache[asset_id]['source'] = 'real_api'
-                    self.price_cache[asset_id]['trend'] = self._calculate_trend(asset_id)
-                    logging.debug(f"✅ سعر حقيقي محدث: {asset_id} = {real_prices[asset_id]['price']}")
-                else:
-                    # استخدام التحديث المحاكي كبديل
-                    if asset_id in self.price_cache:
-                        old_price = self.price_cache[asset_id]['price']
-                        # تغيير صغير في السعر
-                        change = random.uniform(-0.005, 0.005)
-                        new_price = old_price * (1 + change)
-                        
-                        self.price_cache[asset_id]['price'] = new_price
-                        self.price_cache[asset_id]['timestamp'] = current_time
-                        self.price_cache[asset_id]['source'] = 'simulated'
-                        self.price_cache[asset_id]['trend'] = self._calculate_trend(asset_id)
+        # آخر أسعار حقيقية من الخيط الخلفي - تُتجاهل إذا تقادمت فتُستخدم المحاكاة
+        if now - self._real_prices_at < self.real_prices_ttl:
+            real_prices = self._real_prices
+        else:
+            real_prices = {}
         
-        except Exception as e:
-            logging.warning(f"فشل تحديث الأسعار الحقيقية، استخدام المحاكاة: {e}")
-            # العودة للطريقة الأصلية
-            for asset_id in self.price_cache:
-                if asset_id in self.price_cache:
-                    old_price = self.price_cache[asset_id]['price']
-                    # تغيير صغير في السعر
-                    change = random.uniform(-0.005, 0.005)
-                    new_price = old_price * (1 + change)
-                    
-                    self.price_cache[asset_id]['price'] = new_price
-                    self.price_cache[asset_id]['timestamp'] = current_time
-                    self.price_cache[asset_id]['source'] = 'simulated'
-                    self.price_cache[asset_id]['trend'] = self._calculate_trend(asset_id)
+        is_real = np.zeros(self._prices.size, dtype=np.bool_)
+        real_values = np.empty(self._prices.size, dtype=np.float64)
+        # بناء نص السجل لكل أصل في كل تحديث مكلف - فقط إذا كان مستوى DEBUG مفعلاً
+        log_debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+        for asset_id, real_price in real_prices.items():
+            index = self.asset_index.get(asset_id)
+            if index is not None and real_price['source'] == 'real_market':
+                is_real[index] = True
+                real_values[index] = real_price['price']
+                if log_debug:
+                    logging.debug(f"✅ سعر حقيقي محدث: {asset_id} = {real_price['price']}")
+        
+        # تغيير صغير محاكى لكل الأصول في عملية واحدة، ثم استبدال ما له سعر حقيقي
+        previous = self._prices
+        self._prices = previous * (1.0 + self.rng.uniform(-0.005, 0.005, size=previous.size))
+        self._prices[is_real] = real_values[is_real]
+        self._update_indicator_state(self._prices)
+        
+        # تحديث بيانات الأصول التي تغير سعرها فقط (السعر الحقيقي الثابت لا يُعاد كتابته)
+        prices = self._prices.tolist()
+        from_real = is_real.tolist()
+        # المراجع المستخدمة في الحلقة كمتغيرات محلية بدل البحث في الكائن لكل أصل
+        assets, price_entries = self.assets, self.price_entries
+        dirty = self._dirty = set()
+        for index in np.flatnonzero(self._prices != previous).tolist():
+            asset_id = assets[index]['id']
+            entry = price_entries[asset_id]
+            entry.price = prices[index]
+            entry.source = 'real_api' if from_real[index] else 'simulated'
+            entry.timestamp = current_time
+            dirty.add(asset_id)
+        
+        # إعادة حساب اتجاه الأصول التي انتهى قفلها فقط - البقية يبقى اتجاهها المخزن
+        changed = set(dirty)
+        trend_heap = self._trend_heap
+        expired = []
+        while trend_heap and trend_heap[0][0] <= now:
+            _, asset_id = heapq.heappop(trend_heap)
+            expired.append(self.asset_index[asset_id])
+            changed.add(asset_id)
+        if expired:
+            self._calculate_trends(expired)
+        
+        # استبدال عناصر النسخة المرسلة للأصول المتغيرة فقط
+        price_cache = self.price_cache
+        for asset_id in changed:
+            price_cache[asset_id] = price_entries[asset_id].to_dict()
+        
+        if changed:
+            self.price_version += 1
     
     def get_price(self, asset_id: str) -> Optional[Dict[str, Any]]:
         """الحصول على سعر أصل واحد"""
-        return self.price_cache.get(asset_id)
+        if not isinstance(asset_id, str):
+            return None
+        return self.price_cache.get(sys.intern(asset_id))
     
     def get_system_status(self) -> Dict[str, Any]:
         """الحصول على حالة النظام"""
         # فحص نوع مصادر البيانات
-        real_count = sum(1 for asset in self.price_cache.values() if asset.get('source') == 'real_api')
-        simulated_count = len(self.price_cache) - real_count
+        real_count = sum(1 for entry in self.price_entries.values() if entry.source == 'real_api')
+        simulated_count = len(self.price_entries) - real_count
         
         data_mode = 'real_market_data' if real_count > 0 else 'simulated_data'
         
@@ -254,50 +496,143 @@ class PriceService:
             'offline_mode': False,
             'last_update': time.time(),
             'total_assets': len(self.assets),
-            'active_alerts': len(self.alerts),
+            'active_alerts': len(self.alerts_by_id),
             'uptime': 'stable'
         }
     
-    def has_price_changes(self) -> bool:
-        """فحص وجود تغييرات في الأسعار"""
-        current_time = time.time()
-        if current_time - self.last_price_change_check > 5:
-            self.last_price_change_check = current_time
-            return True
-        return random.choice([True, False])
+    def has_price_changes(self, client_id: str = 'default') -> bool:
+        """هل تغيرت الأسعار منذ آخر سؤال من هذا المستهلك - يُسجل الإصدار الحالي كمرئي"""
+        version = self.price_version
+        if self._price_version_seen.get(client_id) == version:
+            return False
+        self._price_version_seen[client_id] = version
+        return True
     
-    def add_alert(self, asset_id: str, threshold: Optional[float], alert_type: str, client_id: str):
+    def add_alert(self, asset_id: str, threshold: Optional[float], alert_type: str, client_id: str) -> int:
         """إضافة تنبيه"""
+        if isinstance(asset_id, str):  # قد يصل من رسالة socket بلا معرف
+            asset_id = sys.intern(asset_id)
+        alert_id = next(self._alert_id_gen)
         alert = {
-            'id': len(self.alerts) + 1,
+            'id': alert_id,
             'asset_id': asset_id,
             'threshold': threshold,
             'type': alert_type,
             'client_id': client_id,
             'created_at': time.time()
         }
-        self.alerts.append(alert)
+        self.alerts_by_id[alert_id] = alert
+        self._alerts_by_asset.setdefault(asset_id, {})[alert_id] = alert
+        if alert_type not in _THRESHOLD_ALERT_TYPES:
+            self._general_alerts.setdefault(asset_id, {})[alert_id] = alert
+        elif threshold is not None:  # تنبيه حد بلا حد لا يُطلق أبداً
+            above, below = self._alert_heaps.setdefault(asset_id, ([], []))
+            if alert_type == 'above':
+                heapq.heappush(above, (threshold, alert_id))
+            else:
+                heapq.heappush(below, (-threshold, alert_id))
+        # ذاكرة محدودة: حذف الأقدم (القاموس يحفظ ترتيب الإضافة)
+        if len(self.alerts_by_id) > MAX_ALERTS:
+            self.remove_alert(next(iter(self.alerts_by_id)))
+        return alert_id
+    
+    def remove_alert(self, alert_id: int) -> bool:
+        """حذف تنبيه بمعرفه"""
+        alert = self.alerts_by_id.pop(alert_id, None)
+        if alert is None:
+            return False
+        asset_id = alert['asset_id']
+        asset_alerts = self._alerts_by_asset.get(asset_id)
+        if asset_alerts is not None:
+            asset_alerts.pop(alert_id, None)
+            if not asset_alerts:
+                del self._alerts_by_asset[asset_id]
+        general = self._general_alerts.get(asset_id)
+        if general is not None and general.pop(alert_id, None) is not None:
+            if not general:
+                del self._general_alerts[asset_id]
+        self._compact_alert_heaps(asset_id)
+        return True
+    
+    def _compact_alert_heaps(self, asset_id: str):
+        """إزالة عناصر التنبيهات المحذوفة من كومتي الأصل عندما تتجاوز ضعف التنبيهات الحية"""
+        heaps = self._alert_heaps.get(asset_id)
+        if heaps is None:
+            return
+        if not heaps[0] and not heaps[1]:
+            del self._alert_heaps[asset_id]
+            return
+        live = len(self._alerts_by_asset.get(asset_id, ()))
+        if len(heaps[0]) + len(heaps[1]) <= 2 * live:
+            return
+        alerts_by_id = self.alerts_by_id
+        for heap in heaps:
+            heap[:] = [item for item in heap if item[1] in alerts_by_id]
+            heapq.heapify(heap)
+        if not heaps[0] and not heaps[1]:
+            del self._alert_heaps[asset_id]
     
     def check_alerts_fast(self, prices: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """فحص التنبيهات"""
+        """فحص التنبيهات - فقط تنبيهات الأصول التي تغير سعرها في آخر تحديث
+        
+        الحركة العامة تُطلق عند تحرك السعر أكثر من GENERAL_ALERT_MOVE_PERCENT منذ آخر إطلاق
+        (أول فحص يسجل السعر فقط)؛ تنبيهات above/below تُسحب من قمة كومتيها ما دام السعر
+        تجاوز حدها فلا يُلمس إلا ما أُطلق، وتُطلق مرة واحدة ثم تُحذف
+        """
         triggered = []
-        for alert in self.alerts:
-            if random.random() < 0.05:  # 5% احتمال تفعيل التنبيه
+        one_shot = []
+        current_time = time.time()
+        alerts_by_id, general_alerts, alert_heaps = self.alerts_by_id, self._general_alerts, self._alert_heaps
+        heappop = heapq.heappop
+        for asset_id in self._dirty:
+            if asset_id not in self._alerts_by_asset:
+                continue
+            price = prices[asset_id]['price']
+            fired = []
+            
+            general = general_alerts.get(asset_id)
+            if general:
+                base_price = self._alert_base_price.get(asset_id)
+                if base_price is None:
+                    self._alert_base_price[asset_id] = price
+                elif abs(price - base_price) / base_price * 100 > GENERAL_ALERT_MOVE_PERCENT:
+                    self._alert_base_price[asset_id] = price
+                    fired.extend(general)
+            
+            heaps = alert_heaps.get(asset_id)
+            if heaps is not None:
+                above, below = heaps
+                while above and above[0][0] <= price:
+                    alert_id = heappop(above)[1]
+                    if alert_id in alerts_by_id:  # المحذوف يُتجاوز
+                        fired.append(alert_id)
+                        one_shot.append(alert_id)
+                while below and -below[0][0] >= price:
+                    alert_id = heappop(below)[1]
+                    if alert_id in alerts_by_id:
+                        fired.append(alert_id)
+                        one_shot.append(alert_id)
+            
+            for alert_id in fired:
                 triggered.append({
-                    'alert_id': alert['id'],
-                    'asset_id': alert['asset_id'],
-                    'message': f"تنبيه: {alert['asset_id']} وصل للهدف",
-                    'timestamp': time.time()
+                    'alert_id': alert_id,
+                    'asset_id': asset_id,
+                    'message': f"تنبيه: {asset_id} وصل للهدف",
+                    'timestamp': current_time
                 })
+        
+        for alert_id in one_shot:
+            self.remove_alert(alert_id)
         return triggered
     
     def generate_trading_signals_fast(self, prices: Dict[str, Any]) -> List[Dict[str, Any]]:
         """توليد إشارات التداول المتوافقة مع الاتجاه"""
+        rng = self._random
         signals = []
         
         # توليد إشارة واحدة متوافقة مع الاتجاه كل فترة
-        if random.random() < 0.1:  # 10% احتمال توليد إشارة
-            asset = random.choice(self.assets)
+        if rng.random() < 0.1:  # 10% احتمال توليد إشارة
+            asset = rng.choice(self.assets)
             asset_id = asset['id']
             
             if asset_id in prices:
@@ -305,50 +640,33 @@ class PriceService:
                 current_trend = prices[asset_id].get('trend', {}).get('trend', 'sideways')
                 
                 # تحديد نوع الإشارة بناءً على الاتجاه - التحليل الموحد
-                if current_trend == 'uptrend':
-                    signal_type = 'BUY'  # قاعدة صارمة: اتجاه صاعد = إشارة شراء فقط
-                    reason_text = "إشارة شراء مؤكدة - اتجاه صاعد قوي"
-                    rsi_range = (50, 70)  # RSI إيجابي قوي
-                    price_change = random.uniform(0.5, 2.0)  # تغيير إيجابي واضح
-                    # جعل SMA القصير أعلى من الطويل (اتجاه صاعد)
-                    sma_multiplier_short = random.uniform(1.005, 1.02)
-                    sma_multiplier_long = random.uniform(0.98, 0.995)
-                elif current_trend == 'downtrend':
-                    signal_type = 'SELL'  # قاعدة صارمة: اتجاه هابط = إشارة بيع فقط
-                    reason_text = "إشارة بيع مؤكدة - اتجاه هابط قوي"
-                    rsi_range = (30, 50)  # RSI سلبي قوي
-                    price_change = random.uniform(-2.0, -0.5)  # تغيير سلبي واضح
-                    # جعل SMA القصير أقل من الطويل (اتجاه هابط)
-                    sma_multiplier_short = random.uniform(0.98, 0.995)
-                    sma_multiplier_long = random.uniform(1.005, 1.02)
-                else:
-                    # اتجاه جانبي - نقلل الإشارات أو نتجنبها
-                    if random.random() < 0.2:  # احتمال أقل جداً للاتجاه الجانبي
-                        # في الاتجاه الجانبي، نولد إشارات حذرة جداً
-                        signal_type = random.choice(['BUY', 'SELL'])
-                        reason_text = "إشارة احتياطية - اتجاه جانبي محدود"
-                        rsi_range = (45, 55)
-                        price_change = random.uniform(-0.5, 0.5)
-                        sma_multiplier_short = random.uniform(0.99, 1.01)
-                        sma_multiplier_long = random.uniform(0.99, 1.01)
-                    else:
-                        return signals  # تجنب إنتاج إشارات في الاتجاه الجانبي
+                profile = _SIGNAL_PROFILES.get(current_trend, _SIGNAL_PROFILES['sideways'])
+                if profile['gate'] is not None and rng.random() >= profile['gate']:
+                    return signals  # تجنب إنتاج إشارات في الاتجاه الجانبي
+                signal_type = profile['type'] or rng.choice(('BUY', 'SELL'))
+                
+                price = prices[asset_id]['price']
+                # المؤشرات الفعلية للأصل من الحالة المتدفقة
+                sma = self.get_sma(asset_id)
+                technical_summary = _TECHNICAL_SUMMARIES.get((current_trend, signal_type))
+                if technical_summary is None:
+                    technical_summary = f"تحليل موحد: اتجاه {current_trend} → إشارة {signal_type} مؤكدة"
                 
                 signal = {
                     'asset_id': asset_id,
                     'asset_name': asset['name'],
                     'type': signal_type,
-                    'price': prices[asset_id]['price'],
-                    'confidence': random.randint(88, 96),  # ثقة أعلى للإشارات المتوافقة
+                    'price': price,
+                    'confidence': rng.randint(88, 96),  # ثقة أعلى للإشارات المتوافقة
                     'timestamp': time.time(),
-                    'reason': f"تحليل فني متقدم مؤكد - {reason_text}",
-                    'rsi': random.randint(rsi_range[0], rsi_range[1]),
-                    'sma_short': prices[asset_id]['price'] * sma_multiplier_short,
-                    'sma_long': prices[asset_id]['price'] * sma_multiplier_long,
-                    'price_change_5': price_change,
+                    'reason': profile['reason'],
+                    'rsi': self.get_rsi(asset_id),
+                    'sma_short': sma['sma_short'],
+                    'sma_long': sma['sma_long'],
+                    'price_change_5': rng.uniform(*profile['price_change']),
                     'trend': current_trend,  # الاتجاه الفعلي المطابق للإشارة
-                    'volatility': random.uniform(0, 1.5),  # تقليل التقلب للإشارات القوية
-                    'technical_summary': f"تحليل موحد: اتجاه {current_trend} → إشارة {signal_type} مؤكدة",
+                    'volatility': rng.uniform(0, 1.5),  # تقليل التقلب للإشارات القوية
+                    'technical_summary': technical_summary,
                     'validated': True,
                     'multi_timeframe': True,
                     'enhanced_analysis': True,
@@ -8,6 +8,7 @@ from flask_socketio import SocketIO, emit
 from flask_login import LoginManager, login_required, logout_user, current_user
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from api_service import PriceService
 from market_ai_engine import analyze_asset_with_ai, get_ai_engine_status
 from comprehensive_trades_tracker import trades_tracker
@@ -148,8 +149,12 @@ def index():
 def get_prices():
     """Get current prices for all assets"""
     try:
-        prices = price_service.get_all_prices()
-        return jsonify({'success': True, 'data': prices})
+        # JSON الأسعار مُسلسل ومخزن لكل إصدار - لا إعادة تسلسل لكل طلب
+        prices_json = price_service.get_all_prices_bytes()
+        return app.response_class(
+            b'{"success":true,"data":' + prices_json + b'}',
+            mimetype='application/json'
+        )
     except Exception as e:
         logging.error(f"Error fetching prices: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -215,13 +220,7 @@ def get_ai_stats():
                 'success_rate': ai_optimizer.learning_data.get('success_rate_improvement', 0),
                 'total_analyzed': ai_optimizer.learning_data.get('total_analyzed', 0)
             },
-            'openai_stats': {
-                'enabled': openai_analyzer.enabled,
-                'model': 'gpt-5' if openai_analyzer.enabled else None,
-                'status': 'quota_exceeded' if openai_analyzer.enabled else 'disabled',
-                'error_memory_count': len(openai_analyzer.error_memory) if openai_analyzer.enabled else 0,
-                'successful_patterns': len(openai_analyzer.successful_patterns) if openai_analyzer.enabled else 0
-            },
+            'openai_stats': openai_analyzer.get_ai_learning_stats(),
             'news_stats': {
                 'enabled': news_service.enabled,
                 'source': 'NewsAPI.org' if news_service.enabled else None,
@@ -285,11 +284,10 @@ def ai_chat():
             })
         
         # الحصول على البيانات الحالية للسوق
-        current_prices = price_service.get_all_prices()
+        current_prices = price_service.get_all_prices_fast()
         
         # استخدام OpenAI للتحليل والرد
         try:
-            from openai import OpenAI
             client = openai_analyzer.client
             
             # إعداد السياق للمحادثة
@@ -559,7 +557,8 @@ def handle_test_connection(data):
 def handle_test_signal(data):
     """Generate a test trading signal"""
     asset_id = data.get('asset_id', 'BTCUSDT')
-    asset_name = next((a['name'] for a in price_service.assets if a['id'] == asset_id), 'BTCUSD')
+    asset = price_service.assets_by_id.get(asset_id)
+    asset_name = asset['name'] if asset else 'BTCUSD'
     
     test_signal = {
         'asset_id': asset_id,
@@ -606,14 +605,7 @@ def handle_random_analysis_signal(data):
         
         # Get asset data for comprehensive analysis
         asset_id = data.get('asset_id')
-        asset_data = None
-        prices = price_service.get_all_prices()
-        
-        if isinstance(prices, list):
-            for p in prices:
-                if isinstance(p, dict) and p.get('id') == asset_id:
-                    asset_data = p
-                    break
+        asset_data = price_service.get_all_prices_fast().get(asset_id)
         
         # Enhance with OpenAI if available and not quota exceeded
         if openai_analyzer.enabled and data.get('confidence', 0) > 75:
@@ -638,7 +630,9 @@ def handle_random_analysis_signal(data):
                     }
                     
                     # Get comprehensive OpenAI analysis
-                    openai_analysis = openai_analyzer.analyze_with_economic_news(asset_data_for_ai, market_data)
+                    openai_analysis = openai_analyzer.analyze_with_economic_news(
+                        asset_data_for_ai, market_data, min_confidence=80
+                    )
                     
                     if openai_analysis and openai_analysis.get('confidence', 0) > 80:
                         # OpenAI enhanced the signal
@@ -679,25 +673,17 @@ def handle_random_analysis_signal(data):
         except Exception as track_error:
             logging.error(f"Error tracking random signal: {track_error}")
         
-        # Save to database
-        try:
-            with app.app_context():
-                from models import TradingSignal, db
-                signal_record = TradingSignal(
-                    asset_id=enhanced_signal.get('asset_id'),
-                    asset_name=enhanced_signal.get('asset_name', enhanced_signal.get('asset_id')),
-                    signal_type=enhanced_signal.get('type'),
-                    price=enhanced_signal.get('price'),
-                    confidence=enhanced_signal.get('final_confidence', enhanced_signal.get('confidence')),
-                    reason=enhanced_signal.get('reason', 'إشارة من التحليل العشوائي'),
-                    ai_confidence=enhanced_signal.get('openai_confidence', enhanced_signal.get('ai_confidence', 0)),
-                    ai_analysis=str(enhanced_signal.get('openai_reasoning', enhanced_signal.get('reason', '')))
-                )
-                db.session.add(signal_record)
-                db.session.commit()
-                logging.info(f"💾 Random signal saved to database")
-        except Exception as db_error:
-            logging.error(f"Database save error for random signal: {db_error}")
+        # Save to database (in the background)
+        save_trading_signal(dict(
+            asset_id=enhanced_signal.get('asset_id'),
+            asset_name=enhanced_signal.get('asset_name', enhanced_signal.get('asset_id')),
+            signal_type=enhanced_signal.get('type'),
+            price=enhanced_signal.get('price'),
+            confidence=enhanced_signal.get('final_confidence', enhanced_signal.get('confidence')),
+            reason=enhanced_signal.get('reason', 'إشارة من التحليل العشوائي'),
+            ai_confidence=enhanced_signal.get('openai_confidence', enhanced_signal.get('ai_confidence', 0)),
+            ai_analysis=str(enhanced_signal.get('openai_reasoning', enhanced_signal.get('reason', '')))
+        ), 'Random signal')
         
         # Emit enhanced signal back to all clients
         socketio.emit('enhanced_random_signal', enhanced_signal)
@@ -724,16 +710,7 @@ def handle_timed_analysis(data):
         """Perform deep analysis after timer expires"""
         try:
             # Get current asset data
-            asset_data = None
-            prices = price_service.get_all_prices()
-            
-            if isinstance(prices, dict):
-                asset_data = prices.get(asset_id)
-            elif isinstance(prices, list) and prices and len(prices) > 0:
-                for p in prices:
-                    if isinstance(p, dict) and p.get('id') == asset_id:
-                        asset_data = p
-                        break
+            asset_data = price_service.get_all_prices_fast().get(asset_id)
             
             if not asset_data:
                 logging.error(f"Asset data not found for {asset_id}")
@@ -834,6 +811,53 @@ def handle_timed_analysis(data):
         'start_time': timestamp
     })
 
+# حفظ الإشارات في قاعدة البيانات خارج حلقة المراقبة - عامل واحد يحافظ على ترتيب الحفظ
+signal_db_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='signal-db')
+
+def _save_trading_signal(fields, label):
+    """حفظ إشارة تداول في قاعدة البيانات (يعمل داخل signal_db_writer)"""
+    try:
+        with app.app_context():
+            from models import TradingSignal
+            db.session.add(TradingSignal(**fields))
+            db.session.commit()
+            logging.info(f"💾 {label} saved to database: {fields.get('signal_type')} {fields.get('asset_id')}")
+    except Exception as db_error:
+        try:
+            db.session.rollback()
+        except:
+            pass
+        logging.error(f"❌ Database save error ({label}): {db_error}")
+
+def save_trading_signal(fields, label='Signal'):
+    """جدولة حفظ الإشارة دون انتظار قاعدة البيانات"""
+    signal_db_writer.submit(_save_trading_signal, fields, label)
+
+def _evaluate_pending_signals(current_prices):
+    """تقييم الإشارات المحفوظة المستحقة دفعة بعد دفعة (يعمل داخل signal_db_writer)"""
+    try:
+        with app.app_context():
+            from models import TradingSignal
+            total = 0
+            while True:
+                evaluated = TradingSignal.evaluate_pending(current_prices)
+                if not evaluated:
+                    break
+                total += evaluated
+            if total:
+                logging.info(f"📊 تم تقييم {total} إشارة محفوظة")
+    except Exception as db_error:
+        try:
+            db.session.rollback()
+        except:
+            pass
+        logging.error(f"❌ Signal evaluation error: {db_error}")
+
+def evaluate_pending_signals(prices):
+    """جدولة تقييم الإشارات المستحقة بآخر الأسعار دون انتظار قاعدة البيانات"""
+    current_prices = {asset_id: data['price'] for asset_id, data in prices.items() if data.get('price')}
+    signal_db_writer.submit(_evaluate_pending_signals, current_prices)
+
 def price_monitor():
     """Background task to monitor prices and send updates - optimized for speed"""
     last_system_status_update = 0
@@ -849,14 +873,18 @@ def price_monitor():
                 # Only send updates every few cycles to avoid overwhelming the connection
                 cycle_count += 1
                 
-                # إرسال تحديثات الأسعار كل 8 ثوان لتقليل الحمل أكثر
-                if cycle_count % 8 == 0:
+                # إرسال تحديثات الأسعار كل 8 ثوان لتقليل الحمل أكثر - فقط إذا تغير الإصدار
+                if cycle_count % 8 == 0 and price_service.has_price_changes('price_monitor'):
                     socketio.emit('price_update', prices)
                 
                 # إرسال حالة النظام كل 15 ثانية
                 if cycle_count % 15 == 0:
                     status = price_service.get_system_status()
                     socketio.emit('system_status', status)
+                
+                # تقييم الإشارات المحفوظة التي مضى عليها 24 ساعة كل 5 دقائق
+                if cycle_count % 60 == 0:
+                    evaluate_pending_signals(prices)
             
             # Check for triggered alerts - optimized
             triggered_alerts = price_service.check_alerts_fast(prices)
@@ -969,34 +997,22 @@ def price_monitor():
                         except Exception as e:
                             logging.error(f"Error tracking AI-enhanced signal: {e}")
                         
-                        # حفظ الإشارة في قاعدة البيانات
-                        try:
-                            with app.app_context():  # إضافة app context للحفظ الآمن
-                                from models import TradingSignal
-                                signal_record = TradingSignal(
-                                    asset_id=enhanced_signal.get('asset_id'),
-                                    asset_name=enhanced_signal.get('asset_name'),
-                                    signal_type=enhanced_signal.get('type'),
-                                    price=enhanced_signal.get('price'),
-                                    confidence=enhanced_signal.get('confidence'),
-                                    reason=enhanced_signal.get('reason'),
-                                    rsi=enhanced_signal.get('rsi'),
-                                    sma_short=enhanced_signal.get('sma_short'),
-                                    sma_long=enhanced_signal.get('sma_long'),
-                                    price_change_5=enhanced_signal.get('price_change_5'),
-                                    trend=enhanced_signal.get('trend'),
-                                    ai_confidence=enhanced_signal.get('ai_confidence'),
-                                    ai_analysis=str(enhanced_signal.get('ai_recommendations', []))
-                                )
-                                db.session.add(signal_record)
-                                db.session.commit()
-                                logging.info(f"💾 Signal saved to database: {enhanced_signal.get('type')} {enhanced_signal.get('asset_id')}")
-                        except Exception as db_error:
-                            try:
-                                db.session.rollback()
-                            except:
-                                pass
-                            logging.error(f"❌ Database save error: {db_error}")
+                        # حفظ الإشارة في قاعدة البيانات (في الخلفية)
+                        save_trading_signal(dict(
+                            asset_id=enhanced_signal.get('asset_id'),
+                            asset_name=enhanced_signal.get('asset_name'),
+                            signal_type=enhanced_signal.get('type'),
+                            price=enhanced_signal.get('price'),
+                            confidence=enhanced_signal.get('confidence'),
+                            reason=enhanced_signal.get('reason'),
+                            rsi=enhanced_signal.get('rsi'),
+                            sma_short=enhanced_signal.get('sma_short'),
+                            sma_long=enhanced_signal.get('sma_long'),
+                            price_change_5=enhanced_signal.get('price_change_5'),
+                            trend=enhanced_signal.get('trend'),
+                            ai_confidence=enhanced_signal.get('ai_confidence'),
+                            ai_analysis=str(enhanced_signal.get('ai_recommendations', []))
+                        ))
                         
                         socketio.emit('trading_signal', enhanced_signal)
                         logging.info(f"🧠 Unified AI signal: {enhanced_signal['type']} {enhanced_signal['asset_name']} (Quality: {quality_analysis['quality_score']}/100)")
@@ -1026,7 +1042,9 @@ def price_monitor():
                                 }
                                 
                                 # تحليل متقدم باستخدام OpenAI
-                                openai_analysis = openai_analyzer.analyze_with_economic_news(asset_data, market_data)
+                                openai_analysis = openai_analyzer.analyze_with_economic_news(
+                                    asset_data, market_data, min_confidence=85
+                                )
                                 
                                 if openai_analysis and openai_analysis.get('confidence', 0) >= 85:
                                     # OpenAI يعتقد أن الإشارة جيدة
@@ -1043,30 +1061,18 @@ def price_monitor():
                                         'reason': f"OpenAI GPT-5 تحليل متقدم: {openai_analysis.get('reasoning', '')[:100]}"
                                     })
                                     
-                                    # حفظ إشارة OpenAI في قاعدة البيانات
-                                    try:
-                                        with app.app_context():  # إضافة app context للحفظ الآمن
-                                            from models import TradingSignal
-                                            signal_record = TradingSignal(
-                                                asset_id=enhanced_signal.get('asset_id'),
-                                                asset_name=enhanced_signal.get('asset_name'),
-                                                signal_type=enhanced_signal.get('type'),
-                                                price=enhanced_signal.get('price'),
-                                                confidence=enhanced_signal.get('confidence', enhanced_signal.get('openai_confidence')),
-                                                reason=enhanced_signal.get('reason'),
-                                                rsi=enhanced_signal.get('rsi'),
-                                                ai_confidence=enhanced_signal.get('openai_confidence'),
-                                                ai_analysis=enhanced_signal.get('openai_reasoning', '')
-                                            )
-                                            db.session.add(signal_record)
-                                            db.session.commit()
-                                            logging.info(f"💾 OpenAI signal saved to database: {enhanced_signal.get('type')} {enhanced_signal.get('asset_id')}")
-                                    except Exception as db_error:
-                                        try:
-                                            db.session.rollback()
-                                        except:
-                                            pass
-                                        logging.error(f"❌ OpenAI Database save error: {db_error}")
+                                    # حفظ إشارة OpenAI في قاعدة البيانات (في الخلفية)
+                                    save_trading_signal(dict(
+                                        asset_id=enhanced_signal.get('asset_id'),
+                                        asset_name=enhanced_signal.get('asset_name'),
+                                        signal_type=enhanced_signal.get('type'),
+                                        price=enhanced_signal.get('price'),
+                                        confidence=enhanced_signal.get('confidence', enhanced_signal.get('openai_confidence')),
+                                        reason=enhanced_signal.get('reason'),
+                                        rsi=enhanced_signal.get('rsi'),
+                                        ai_confidence=enhanced_signal.get('openai_confidence'),
+                                        ai_analysis=enhanced_signal.get('openai_reasoning', '')
+                                    ), 'OpenAI signal')
                                     
                                     socketio.emit('trading_signal', enhanced_signal)
                                     logging.info(f"🎆 OpenAI override signal: {enhanced_signal['type']} {enhanced_signal['asset_name']}")
@@ -1149,6 +1155,7 @@ def finalize_trade():
         })
 
 # Start background price monitoring
+price_service.start()
 price_monitor_thread = threading.Thread(target=price_monitor, daemon=True)
 price_monitor_thread.start()
 
@@ -6,6 +6,7 @@
 import os
 import logging
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import time
 from typing import Dict, List, Optional
@@ -28,6 +29,11 @@ class EconomicNewsService:
         
         # إعدادات الـ API
         self.base_url = "https://newsapi.org/v2"
+        # جلسة مشتركة باتصالات دائمة - بدل مصافحة TCP/TLS جديدة لكل طلب أخبار
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         self.cache = {}
         self.cache_duration = 1800  # 30 دقيقة - تقليل الطلبات
         self.last_request_time = 0
@@ -90,7 +96,7 @@ class EconomicNewsService:
                 time.sleep(self.min_request_interval)
             
             # إجراء الطلب
-            response = requests.get(url, params=params, timeout=5)
+            response = self.session.get(url, params=params, timeout=5)
             self.last_request_time = time.time()
             
             if response.status_code == 200:
@@ -156,7 +162,7 @@ class EconomicNewsService:
                 'pageSize': limit
             }
             
-            response = requests.get(url, params=params, timeout=5)
+            response = self.session.get(url, params=params, timeout=5)
             
             if response.status_code == 200:
                 data = response.json()
@@ -363,16 +363,14 @@ class LosingTradesTracker:
         # حساب إحصائيات اليوم
         today_start = time.time() - 24 * 3600  # منذ 24 ساعة
         
+        # استعلام تجميعي واحد بدلاً من استعلامين منفصلين
         cursor.execute('''
-            SELECT COUNT(*) FROM losing_trades WHERE entry_time > ?
+            SELECT COUNT(*) as total,
+                   SUM(CASE WHEN exit_time IS NOT NULL THEN 1 ELSE 0 END) as losing,
+                   AVG(CASE WHEN exit_time IS NOT NULL THEN loss_percentage ELSE NULL END) as avg_loss
+            FROM losing_trades WHERE entry_time > ?
         ''', (today_start,))
-        total_signals = cursor.fetchone()[0]
-        
-        cursor.execute('''
-            SELECT COUNT(*), AVG(loss_percentage) FROM losing_trades 
-            WHERE exit_time IS NOT NULL AND entry_time > ?
-        ''', (today_start,))
-        losing_signals, avg_loss = cursor.fetchone()
+        total_signals, losing_signals, avg_loss = cursor.fetchone()
         
         loss_rate = (losing_signals / total_signals * 100) if total_signals > 0 else 0
         
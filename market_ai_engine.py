@@ -14,6 +14,7 @@ import time
 import random
 import math
 import logging
+from collections import deque
 from typing import Dict, List, Optional, Tuple, Any
 from dataclasses import dataclass
 from enum import Enum
@@ -96,7 +97,7 @@ class AdvancedMarketAI:
         self.signal_lock_duration = 3600     # ساعة واحدة قفل للإشارة
         
         # ذاكرة التعلم والإحصائيات
-        self.signal_history = []
+        self.signal_history = deque(maxlen=500)  # آخر 500 إشارة - الأقدم يُحذف تلقائياً
         self.active_signals = {}
         self.learning_data = {}
         
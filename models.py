@@ -3,6 +3,11 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 import hashlib
+from functools import lru_cache
+from typing import Dict
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+import numpy as np
 
 db = SQLAlchemy()
 
@@ -338,6 +343,60 @@ class TradingSignal(db.Model):
         self.evaluation_time = datetime.utcnow()
         db.session.commit()
     
+    @staticmethod
+    def evaluate_pending(current_prices: Dict[str, float], hours_later: int = 24,
+                         batch_size: int = 100) -> int:
+        """تقييم دفعة من الإشارات غير المقيّمة الأقدم من hours_later
+
+        نفس قاعدة evaluate_success، لكن الحساب على مصفوفات numpy
+        والتحديث بعبارة مجمّعة واحدة مع commit واحد. يعيد عدد الإشارات المقيّمة؛
+        يُستدعى بشكل متكرر حتى يعيد 0.
+        """
+        if not current_prices:
+            return 0
+        
+        now = datetime.utcnow()
+        cutoff = now - timedelta(hours=hours_later)
+        rows = db.session.execute(
+            db.select(
+                TradingSignal.id,
+                TradingSignal.asset_id,
+                TradingSignal.signal_type,
+                TradingSignal.price
+            ).where(
+                TradingSignal.evaluation_time == None,
+                TradingSignal.created_at <= cutoff,
+                TradingSignal.price > 0,  # سعر دخول صفري أو فارغ لا يعطي نسبة ربح صالحة
+                TradingSignal.asset_id.in_(list(current_prices))
+            ).order_by(
+                TradingSignal.id
+            ).limit(batch_size)
+        ).all()
+        
+        if not rows:
+            return 0
+        
+        ids, asset_ids, signal_types, entry_prices = zip(*rows)
+        entry = np.asarray(entry_prices, dtype=np.float64)
+        exit_ = np.fromiter((current_prices[a] for a in asset_ids), dtype=np.float64, count=len(rows))
+        is_buy = np.asarray(signal_types) == 'BUY'
+        
+        price_change = (exit_ - entry) / entry * 100
+        profit_loss = np.where(is_buy, price_change, -price_change)
+        successful = profit_loss > 0.5  # ربح أكثر من 0.5% في اتجاه الإشارة
+        
+        db.session.bulk_update_mappings(TradingSignal, [
+            {
+                'id': signal_id,
+                'is_successful': bool(success),
+                'profit_loss_percent': float(pl),
+                'evaluation_time': now
+            }
+            for signal_id, success, pl in zip(ids, successful, profit_loss)
+        ])
+        db.session.commit()
+        return len(rows)
+    
     @staticmethod
     def get_failed_signals_patterns(asset_id = None, limit: int = 100):
         """الحصول على أنماط الإشارات الفاشلة للتعلم منها"""
@@ -409,27 +468,23 @@ class AILearningData(db.Model):
     @staticmethod
     def should_avoid_signal(asset_id: str, signal_data: dict) -> tuple[bool, str]:
         """فحص ما إذا كان يجب تجنب إرسال إشارة معينة"""
-        learning_rules = AILearningData.query.filter_by(asset_id=asset_id).all()
+        learning_rules = _compiled_avoidance_rules(asset_id, _learning_rule_versions.get(asset_id, 0))
         
-        for rule in learning_rules:
+        for rsi_above, rsi_below, trend, candlestick_pattern in learning_rules:
             # فحص RSI
-            if (rule.avoid_when_rsi_above and 
-                signal_data.get('rsi', 0) > rule.avoid_when_rsi_above):
-                return True, f"تجنب الإشارة: RSI أعلى من {rule.avoid_when_rsi_above}"
+            if rsi_above and signal_data.get('rsi', 0) > rsi_above:
+                return True, f"تجنب الإشارة: RSI أعلى من {rsi_above}"
             
-            if (rule.avoid_when_rsi_below and 
-                signal_data.get('rsi', 100) < rule.avoid_when_rsi_below):
-                return True, f"تجنب الإشارة: RSI أقل من {rule.avoid_when_rsi_below}"
+            if rsi_below and signal_data.get('rsi', 100) < rsi_below:
+                return True, f"تجنب الإشارة: RSI أقل من {rsi_below}"
             
             # فحص الاتجاه
-            if (rule.avoid_when_trend and 
-                signal_data.get('trend') == rule.avoid_when_trend):
-                return True, f"تجنب الإشارة: الاتجاه {rule.avoid_when_trend}"
+            if trend and signal_data.get('trend') == trend:
+                return True, f"تجنب الإشارة: الاتجاه {trend}"
             
             # فحص نمط الشموع
-            if (rule.avoid_candlestick_pattern and 
-                signal_data.get('candlestick_pattern') == rule.avoid_candlestick_pattern):
-                return True, f"تجنب الإشارة: نمط الشموع {rule.avoid_candlestick_pattern}"
+            if candlestick_pattern and signal_data.get('candlestick_pattern') == candlestick_pattern:
+                return True, f"تجنب الإشارة: نمط الشموع {candlestick_pattern}"
         
         return False, ""
     
@@ -437,6 +492,45 @@ class AILearningData(db.Model):
         return f'<AILearningData {self.asset_id} - {self.failed_pattern_type}>'
 
 
+
+# إصدار قواعد التجنب لكل أصل - يزيد بعد كل commit يغيّر قواعد ذلك الأصل،
+# فتصبح النسخة المخزنة في _compiled_avoidance_rules قديمة ويُعاد تحميلها
+_learning_rule_versions: Dict[str, int] = {}
+
+
+@lru_cache(maxsize=128)
+def _compiled_avoidance_rules(asset_id: str, version: int) -> tuple:
+    """قواعد تجنب الأصل كصفوف ثابتة (rsi_above, rsi_below, trend, candlestick_pattern)"""
+    return tuple(
+        (
+            rule.avoid_when_rsi_above,
+            rule.avoid_when_rsi_below,
+            rule.avoid_when_trend,
+            rule.avoid_candlestick_pattern
+        )
+        for rule in AILearningData.query.filter_by(asset_id=asset_id).all()
+    )
+
+
+@event.listens_for(AILearningData, 'after_insert')
+@event.listens_for(AILearningData, 'after_update')
+@event.listens_for(AILearningData, 'after_delete')
+def _mark_learning_rules_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('changed_rule_assets', set()).add(target.asset_id)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _bump_learning_rule_versions(session):
+    for asset_id in session.info.pop('changed_rule_assets', ()):
+        _learning_rule_versions[asset_id] = _learning_rule_versions.get(asset_id, 0) + 1
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_learning_rule_changes(session):
+    session.info.pop('changed_rule_assets', None)
+
 class MarketData(db.Model):
     """نموذج بيانات السوق التاريخية"""
     __tablename__ = 'market_data'
@@ -485,27 +579,53 @@ class MarketData(db.Model):
             MarketData.timestamp >= since
         ).order_by(MarketData.timestamp.asc()).all()
     
+    @staticmethod
+    def get_recent_arrays(asset_id: str, hours: int = 24) -> Dict[str, np.ndarray]:
+        """البيانات الحديثة كمصفوفات عمودية (OHLCV + RSI + الوقت) باستعلام واحد
+
+        تُقرأ الأعمدة المطلوبة فقط دون إنشاء كائنات ORM لكل صف؛
+        قيم RSI الفارغة تصبح NaN.
+        """
+        since = datetime.utcnow() - timedelta(hours=hours)
+        rows = db.session.execute(
+            db.select(
+                MarketData.open_price,
+                MarketData.high_price,
+                MarketData.low_price,
+                MarketData.close_price,
+                MarketData.volume,
+                MarketData.rsi,
+                MarketData.timestamp
+            ).where(
+                MarketData.asset_id == asset_id,
+                MarketData.timestamp >= since
+            ).order_by(MarketData.timestamp.asc())
+        ).all()
+        
+        columns = list(zip(*rows)) if rows else [()] * 7
+        return {
+            'open': np.asarray(columns[0], dtype=np.float64),
+            'high': np.asarray(columns[1], dtype=np.float64),
+            'low': np.asarray(columns[2], dtype=np.float64),
+            'close': np.asarray(columns[3], dtype=np.float64),
+            'volume': np.asarray(columns[4], dtype=np.float64),
+            'rsi': np.asarray(columns[5], dtype=np.float64),
+            'ts': np.asarray(columns[6], dtype='datetime64[us]')
+        }
+    
     @staticmethod
     def calculate_support_resistance(asset_id: str, days: int = 7):
         """حساب مستويات الدعم والمقاومة"""
-        since = datetime.utcnow() - timedelta(days=days)
-        data = MarketData.query.filter(
-            MarketData.asset_id == asset_id,
-            MarketData.timestamp >= since
-        ).all()
+        data = MarketData.get_recent_arrays(asset_id, hours=days * 24)
+        highs = data['high']
+        lows = data['low']
         
-        if len(data) < 10:
+        if len(highs) < 10:
             return None, None
         
-        highs = [d.high_price for d in data]
-        lows = [d.low_price for d in data]
-        
-        # حساب الدعم والمقاومة كمتوسط للقمم والقيعان
-        sorted_highs = sorted(highs, reverse=True)
-        sorted_lows = sorted(lows)
-        
-        resistance = sum(sorted_highs[:3]) / 3  # متوسط أعلى 3 قيم
-        support = sum(sorted_lows[:3]) / 3      # متوسط أقل 3 قيم
+        # حساب الدعم والمقاومة كمتوسط للقمم والقيعان (دون ترتيب كامل)
+        resistance = float(np.partition(highs, -3)[-3:].mean())  # متوسط أعلى 3 قيم
+        support = float(np.partition(lows, 2)[:3].mean())        # متوسط أقل 3 قيم
         
         return support, resistance
     
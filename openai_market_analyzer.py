@@ -5,15 +5,306 @@
 
 import os
 import json
+import hashlib
+import re
 import logging
 import time
-from typing import Dict, List, Optional, Tuple
+import random
+import threading
+import importlib.util
+from collections import deque
+from itertools import islice
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
-from openai import OpenAI
 import requests
+import numpy as np
+
+try:
+    # محلل JSON مكتوب بـ C لردود النموذج - اختياري
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+if TYPE_CHECKING:
+    # حزمة openai (ومعها httpx و pydantic) تُستورد عند أول استخدام فعلي فقط
+    import httpx
+    from openai import OpenAI
+
+logger = logging.getLogger(__name__)
 
 # Using GPT-4o as the latest available model (gpt-5 not yet released)
-OPENAI_MODEL = "gpt-4o"
+OPENAI_MODEL = os.environ.get("OPENAI_MODEL", "gpt-4o")
+
+# نماذج الاستدلال (o-series و gpt-5) تقبل reasoning_effort ولا تقبل temperature مخصصة
+REASONING_MODEL_PREFIXES = ("o1", "o3", "o4", "gpt-5")
+
+_retryable_openai_errors = None
+
+
+def retryable_openai_errors() -> Tuple[type, ...]:
+    """الأخطاء المؤقتة التي تستحق إعادة المحاولة (حد المعدل، انقطاع الاتصال، انتهاء المهلة)"""
+    global _retryable_openai_errors
+    if _retryable_openai_errors is None:
+        from openai import RateLimitError, APIConnectionError, APITimeoutError
+        _retryable_openai_errors = (RateLimitError, APIConnectionError, APITimeoutError)
+    return _retryable_openai_errors
+
+
+# تعليمات النظام الثابتة - تأتي أولاً في كل طلب وبنص مطابق تماماً
+# حتى يستفيد OpenAI من التخزين المؤقت التلقائي للبادئة (prompt caching)،
+# بينما تأتي بيانات السوق المتغيرة في رسالة المستخدم بعدها
+SYSTEM_PROMPT = """أنت خبير تحليل مالي متخصص في الأسواق المالية مع خبرة عميقة في:
+1. التحليل الفني للمؤشرات (RSI, MACD, Bollinger Bands, Stochastic)
+2. التحليل الأساسي والأخبار الاقتصادية
+3. إدارة المخاطر وتحديد نقاط الدخول والخروج
+4. التنبؤ بحركة الأسعار بناءً على الأنماط التاريخية
+
+مهمتك:
+- تحليل البيانات المقدمة بدقة عالية
+- إصدار إشارات تداول مضمونة فقط عندما تكون الظروف مثالية
+- تجنب الإشارات الخاطئة بناءً على الأخطاء السابقة
+- دمج تأثير الأخبار الاقتصادية في التحليل
+- تقديم نسبة ثقة واقعية (لا تعطي إشارة إذا الثقة أقل من 85%)
+- تقديم تحليل شامل مع التركيز على الدقة وتجنب الإشارات الخاطئة
+
+يجب أن تكون إجابتك بصيغة JSON دائماً مع الحقول التالية:
+{
+    "signal": "BUY" أو "SELL" أو "HOLD",
+    "confidence": رقم بين 0-100,
+    "reasoning": شرح مفصل بالعربية,
+    "entry_price": سعر الدخول المقترح,
+    "stop_loss": نقطة وقف الخسارة,
+    "take_profit": نقطة جني الأرباح,
+    "risk_level": "low" أو "medium" أو "high",
+    "news_impact": تأثير الأخبار الاقتصادية,
+    "technical_score": درجة التحليل الفني (0-100),
+    "fundamental_score": درجة التحليل الأساسي (0-100),
+    "recommendations": قائمة بالتوصيات
+}"""
+
+# قالب طلب التحليل - يُحلَّل مرة واحدة عند التحميل ويُملأ بـ format_map لكل أصل
+ANALYSIS_PROMPT_TEMPLATE = """حلل الأصل المالي التالي وقدم توصية تداول دقيقة:
+
+الأصل: {name}
+السعر الحالي: ${price:.4f}
+التغير (24 ساعة): {change_24h:.2f}%
+الحجم: ${volume:,.0f}
+
+المؤشرات الفنية:
+- RSI: {rsi:.2f}
+- MACD: {macd:.4f}
+- Bollinger Bands: Upper={bb_upper:.4f}, Lower={bb_lower:.4f}
+- Stochastic: K={stoch_k:.2f}, D={stoch_d:.2f}
+- Moving Averages: SMA50={sma_50:.4f}, SMA200={sma_200:.4f}
+
+بيانات السوق:
+- الاتجاه: {trend}
+- التقلب: {volatility:.2f}
+- قوة الاتجاه: {trend_strength:.1f}%
+- مستوى الدعم: ${support:.4f}
+- مستوى المقاومة: ${resistance:.4f}
+
+الأخبار الاقتصادية المؤثرة:"""
+
+# تعليمات ثابتة لتقييم الإشارات وتوقع الحركة (البيانات المتغيرة في رسالة المستخدم)
+ENHANCEMENT_SYSTEM_PROMPT = (
+    "أنت محلل مالي خبير. قيّم الإشارات بسرعة ودقة.\n"
+    "قيّم الإشارة المقدمة: هل هي إشارة جيدة؟ كيف يمكن تحسينها؟ "
+    "قدم تقييماً سريعاً بصيغة JSON."
+)
+
+PREDICTION_SYSTEM_PROMPT = (
+    "أنت خبير في التنبؤ بحركة الأسعار بناءً على التحليل الفني.\n"
+    "توقع حركة السعر للساعة القادمة بناءً على البيانات المقدمة، "
+    "وقدم توقعاً بصيغة JSON مع: direction (up/down/sideways)، probability (0-100)، "
+    "target_price (السعر المتوقع)، reasoning (السبب)."
+)
+
+class RequestRateLimiter:
+    """محدد معدل بدلوين: طلبات في الدقيقة وتوكنات في الدقيقة، يُعاد ملؤهما باستمرار"""
+    
+    def __init__(self, max_requests_per_minute: float, max_tokens_per_minute: float):
+        self.max_requests = float(max_requests_per_minute)
+        self.max_tokens = float(max_tokens_per_minute)
+        self.available_requests = self.max_requests
+        self.available_tokens = self.max_tokens
+        self.last_update = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _refill(self):
+        """إعادة ملء الدلوين حسب الوقت المنقضي"""
+        now = time.monotonic()
+        elapsed = now - self.last_update
+        self.last_update = now
+        self.available_requests = min(
+            self.max_requests,
+            self.available_requests + elapsed * self.max_requests / 60.0
+        )
+        self.available_tokens = min(
+            self.max_tokens,
+            self.available_tokens + elapsed * self.max_tokens / 60.0
+        )
+    
+    def acquire(self, tokens: int):
+        """الانتظار حتى تتوفر سعة لطلب واحد بعدد التوكنات المقدر"""
+        tokens = min(float(tokens), self.max_tokens)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.available_requests >= 1 and self.available_tokens >= tokens:
+                    self.available_requests -= 1
+                    self.available_tokens -= tokens
+                    return
+                wait = max(
+                    (1 - self.available_requests) * 60.0 / self.max_requests,
+                    (tokens - self.available_tokens) * 60.0 / self.max_tokens,
+                    0.01
+                )
+            time.sleep(wait)
+
+
+_token_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """عدّ توكنات النص - tiktoken إن كان مثبتاً، وإلا تقدير تقريبي من حجم النص"""
+    global _token_encoding
+    if _token_encoding is None:
+        try:
+            import tiktoken
+            _token_encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _token_encoding = False
+    if _token_encoding:
+        return len(_token_encoding.encode(text))
+    # تقدير: ~4 بايت لكل توكن (الحروف العربية بايتان في UTF-8)
+    return len(text.encode('utf-8')) // 4
+
+
+_TREND_CODES = {'bullish': 1.0, 'up': 1.0, 'bearish': -1.0, 'down': -1.0}
+
+
+def market_feature_vector(asset_data: Dict, market_data: Dict) -> np.ndarray:
+    """متجه خصائص مختصر ومطبّع للقطة السوق - كل بُعد بمقياس قريب من الوحدة"""
+    price = float(asset_data.get('price', 0) or 0)
+
+    def distance(level) -> float:
+        # بُعد المستوى عن السعر الحالي كنسبة (0.05 = 5% تقريباً بوحدة واحدة)
+        level = float(level or 0)
+        if price <= 0 or level <= 0:
+            return 0.0
+        return (level / price - 1.0) * 20.0
+
+    vector = np.array([
+        1.0,  # بُعد ثابت حتى لا تتأرجح الزاوية عند اللقطات الهادئة القريبة من الصفر
+        (float(market_data.get('rsi', 50)) - 50.0) / 50.0,
+        distance(market_data.get('sma_50')),
+        distance(market_data.get('sma_200')),
+        float(np.tanh(float(asset_data.get('change_24h', 0) or 0) / 5.0)),
+        _TREND_CODES.get(market_data.get('trend', 'sideways'), 0.0),
+        distance(market_data.get('support')),
+        distance(market_data.get('resistance')),
+    ], dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class SemanticResponseCache:
+    """ذاكرة مؤقتة دلالية لردود التحليل لكل أصل
+
+    تُعاد نتيجة تحليل سابقة إذا كانت لقطة السوق الحالية شبه مطابقة لها
+    (تشابه جيب التمام فوق العتبة) وما زالت ضمن مدة الصلاحية.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.98, ttl_seconds: float = 300, max_entries: int = 32):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}  # asset_id -> deque[(timestamp, vector, response)]
+        self._lock = threading.Lock()
+
+    def get(self, asset_id: str, vector: np.ndarray) -> Optional[Dict]:
+        """أقرب رد مخزن ضمن مدة الصلاحية، أو None"""
+        cutoff = time.monotonic() - self.ttl_seconds
+        with self._lock:
+            entries = self._entries.get(asset_id)
+            # المدخلات مرتبة زمنياً: حذف المنتهية من البداية
+            while entries and entries[0][0] < cutoff:
+                entries.popleft()
+            if not entries:
+                self.misses += 1
+                return None
+            similarities = np.stack([entry[1] for entry in entries]) @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(entries[best][2])
+
+    def put(self, asset_id: str, vector: np.ndarray, response: Dict):
+        with self._lock:
+            entries = self._entries.setdefault(asset_id, deque(maxlen=self.max_entries))
+            entries.append((time.monotonic(), vector, dict(response)))
+
+
+def _json_schema_format(name: str, properties: Dict) -> Dict:
+    """بناء response_format بمخطط JSON صارم - OpenAI يضمن إجابة مطابقة للمخطط"""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": name,
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": properties,
+                "required": list(properties),
+                "additionalProperties": False
+            }
+        }
+    }
+
+
+# مخطط نتيجة التحليل الكامل (نفس الحقول المطلوبة في تعليمات النظام)
+TRADING_SIGNAL_SCHEMA = _json_schema_format("trading_signal", {
+    "signal": {"type": "string", "enum": ["BUY", "SELL", "HOLD"]},
+    "confidence": {"type": "integer"},
+    "reasoning": {"type": "string"},
+    "entry_price": {"type": "number"},
+    "stop_loss": {"type": "number"},
+    "take_profit": {"type": "number"},
+    "risk_level": {"type": "string", "enum": ["low", "medium", "high"]},
+    "news_impact": {"type": "string"},
+    "technical_score": {"type": "integer"},
+    "fundamental_score": {"type": "integer"},
+    "recommendations": {"type": "array", "items": {"type": "string"}}
+})
+
+# حقل الثقة مكتملاً (متبوعاً بفاصلة أو نهاية الكائن) أثناء بث الرد
+CONFIDENCE_FIELD = re.compile(r'"confidence"\s*:\s*(-?\d+(?:\.\d+)?)\s*[,}]')
+
+# مخطط تقييم الإشارة
+SIGNAL_ENHANCEMENT_SCHEMA = _json_schema_format("signal_enhancement", {
+    "confidence": {"type": "integer"},
+    "should_proceed": {"type": "boolean"},
+    "analysis": {"type": "string"},
+    "recommendations": {"type": "array", "items": {"type": "string"}}
+})
+
+# مخطط معنويات السوق
+MARKET_SENTIMENT_SCHEMA = _json_schema_format("market_sentiment", {
+    "sentiment": {"type": "string", "enum": ["bullish", "bearish", "neutral"]},
+    "score": {"type": "integer"}
+})
+
+# مخطط توقع حركة السعر
+PRICE_PREDICTION_SCHEMA = _json_schema_format("price_prediction", {
+    "direction": {"type": "string", "enum": ["up", "down", "sideways"]},
+    "probability": {"type": "integer"},
+    "target_price": {"type": "number"},
+    "reasoning": {"type": "string"}
+})
 
 class OpenAIMarketAnalyzer:
     """محلل السوق المتطور باستخدام OpenAI GPT-5"""
@@ -21,38 +312,112 @@ class OpenAIMarketAnalyzer:
     def __init__(self):
         """تهيئة محلل OpenAI"""
         self.api_key = os.environ.get("OPENAI_API_KEY")
+        # يتم إنشاء العميل عند أول استخدام فقط (انظر client)
+        self._client = None
+        self._client_lock = threading.Lock()
         if not self.api_key:
-            logging.warning("⚠️ مفتاح OpenAI غير موجود - سيعمل النظام بالتحليل الداخلي فقط")
-            self.client = None
+            logger.warning("⚠️ مفتاح OpenAI غير موجود - سيعمل النظام بالتحليل الداخلي فقط")
             self.enabled = False
         else:
-            try:
-                self.client = OpenAI(api_key=self.api_key)
-                self.enabled = True
-                logging.info(f"✅ تم تفعيل OpenAI GPT-4o للتحليل المتقدم")
-            except Exception as e:
-                logging.error(f"❌ خطأ في تهيئة OpenAI: {e}")
-                self.client = None
-                self.enabled = False
+            self.enabled = True
+            logger.info("✅ تم تفعيل OpenAI GPT-4o للتحليل المتقدم")
         
         # إعدادات التحليل
-        self.temperature = 0.7  # إعدادات للحصول على إجابات متوازنة
-        self.max_completion_tokens = 1000
-        
+        # حد توكنات الرد بحجم كائن JSON المتوقع (المخطط يمنع الحشو والاسترسال)
+        self.max_completion_tokens = 500
+        # جهد استدلال منخفض = توكنات تفكير مخفية أقل (لنماذج الاستدلال فقط)
+        self.reasoning_effort = os.environ.get("OPENAI_REASONING_EFFORT", "low")
+
+        # الحد الأقصى لتوكنات طلب التحليل (تعليمات المستخدم)
+        self.prompt_token_budget = 3000
+
+        # إعدادات التحليل المعروضة في إحصائيات النظام
+        self.analysis_settings = {
+            'market_analysis_enabled': True,
+            'technical_indicators': True,
+            'sentiment_analysis': True,
+            'risk_assessment': True
+        }
+
+        # تنظيم معدل الطلبات ضمن حدود الحساب (طلبات وتوكنات في الدقيقة)
+        self.rate_limiter = RequestRateLimiter(
+            max_requests_per_minute=int(os.environ.get("OPENAI_MAX_RPM", 500)),
+            max_tokens_per_minute=int(os.environ.get("OPENAI_MAX_TPM", 30000))
+        )
+
+        # إعادة المحاولة مع تراجع أسي عشوائي عند الأخطاء المؤقتة
+        self.max_retry_attempts = 5
+        self.retry_min_wait = 1
+        self.retry_max_wait = 20
+
         # ذاكرة التعلم من الأخطاء السابقة
-        self.error_memory = []
-        self.successful_patterns = []
+        # deque بحد أقصى: يتم حذف الأقدم تلقائياً دون نسخ القائمة
+        self.error_memory = deque(maxlen=20)
+        self.successful_patterns = deque(maxlen=50)
+        # قفل مشترك بين خيط مراقبة الأسعار وطلبات الويب المتزامنة
+        self._lock = threading.Lock()
         
         # إعدادات الأخبار الاقتصادية
         self.news_cache = {}
         self.news_cache_duration = 300  # 5 دقائق
+
+        # ذاكرة مؤقتة مطابقة تماماً لنص الطلب (مفتاح SHA256) - تُحدَّث بعد انتهاء المدة
+        self.response_cache = {}
+        self.response_cache_duration = int(os.environ.get("OPENAI_RESPONSE_CACHE_TTL", 300))
+        self.response_cache_max_entries = 512
+
+        # إعادة استخدام التحليل عندما تتكرر لقطة سوق شبه مطابقة لنفس الأصل
+        self.semantic_cache = SemanticResponseCache(
+            similarity_threshold=0.98,
+            ttl_seconds=300
+        )
         
-    def analyze_with_economic_news(self, asset_data: Dict, market_data: Dict) -> Optional[Dict]:
-        """تحليل الأصل مع دمج الأخبار الاقتصادية"""
+    @property
+    def client(self) -> Optional["OpenAI"]:
+        """عميل OpenAI - يُنشأ عند أول استدعاء فعلي لتجنب كلفته عند عدم استخدام الذكاء الاصطناعي"""
+        if self._client is None and self.enabled:
+            with self._client_lock:
+                if self._client is None and self.enabled:
+                    try:
+                        from openai import OpenAI
+                        self._client = OpenAI(api_key=self.api_key, http_client=self._create_http_client())
+                    except Exception as e:
+                        logger.error("❌ خطأ في تهيئة OpenAI: %s", e)
+                        self.enabled = False
+        return self._client
+
+    def _create_http_client(self) -> "httpx.Client":
+        """عميل HTTP مشترك طوال عمر العملية - اتصالات دائمة بدل مصافحة TLS لكل طلب
+
+        يُفعَّل HTTP/2 فقط إذا كانت حزمة h2 مثبتة (httpx[http2]).
+        """
+        import httpx
+        return httpx.Client(
+            http2=importlib.util.find_spec("h2") is not None,
+            limits=httpx.Limits(
+                max_connections=32,
+                max_keepalive_connections=16
+            ),
+            timeout=httpx.Timeout(120.0, connect=5.0)
+        )
+
+    def analyze_with_economic_news(self, asset_data: Dict, market_data: Dict,
+                                   min_confidence: Optional[float] = None) -> Optional[Dict]:
+        """تحليل الأصل مع دمج الأخبار الاقتصادية
+
+        min_confidence: أقل ثقة يقبلها المستدعي - يُوقف بث الرد ويعيد None فور ظهور ثقة
+        أقل منها؛ None = استلام الرد كاملاً مهما كانت الثقة
+        """
         if not self.enabled or not self.client:
             return None
         
         try:
+            # لقطة سوق شبه مطابقة حُللت مؤخراً: لا حاجة لاستدعاء النموذج
+            feature_vector = market_feature_vector(asset_data, market_data)
+            cached_result = self.semantic_cache.get(asset_data['id'], feature_vector)
+            if cached_result is not None:
+                return self._validate_against_errors(cached_result)
+            
             # جلب الأخبار الاقتصادية المؤثرة
             economic_news = self._fetch_economic_news(asset_data['id'])
             
@@ -63,29 +428,33 @@ class OpenAIMarketAnalyzer:
                 economic_news
             )
             
-            # التحليل باستخدام GPT-5
-            response = self.client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": self._get_system_prompt()
-                    },
-                    {
-                        "role": "user",
-                        "content": analysis_prompt
-                    }
-                ],
-                temperature=1,  # GPT-5 يدعم فقط temperature=1
-                max_completion_tokens=self.max_completion_tokens,
-                response_format={"type": "json_object"}
-            )
-            
-            # معالجة النتيجة
-            content = response.choices[0].message.content
-            if not content:
-                return None
-            analysis_result = json.loads(content)
+            # نفس الطلب حرفياً خلال مدة الصلاحية: إعادة الرد المخزن
+            prompt_key = hashlib.sha256(analysis_prompt.encode('utf-8')).hexdigest()
+            content = self._get_cached_response(prompt_key)
+            if content is None:
+                # التحليل باستخدام GPT-5 (ببث الرد لإيقاف الإشارات الضعيفة مبكراً)
+                content = self._stream_analysis(
+                    min_confidence,
+                    model=OPENAI_MODEL,
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": self._get_system_prompt()
+                        },
+                        {
+                            "role": "user",
+                            "content": analysis_prompt
+                        }
+                    ],
+                    temperature=1,  # GPT-5 يدعم فقط temperature=1
+                    max_completion_tokens=self.max_completion_tokens,
+                    response_format=TRADING_SIGNAL_SCHEMA
+                )
+                if not content:
+                    return None
+                self._cache_response(prompt_key, content)
+            analysis_result = json_loads(content)
+            self.semantic_cache.put(asset_data['id'], feature_vector, analysis_result)
             
             # التحقق من دقة التحليل بناءً على الأخطاء السابقة
             validated_result = self._validate_against_errors(analysis_result)
@@ -97,80 +466,146 @@ class OpenAIMarketAnalyzer:
             return validated_result
             
         except Exception as e:
-            logging.error(f"خطأ في تحليل OpenAI: {e}")
+            logger.error("خطأ في تحليل OpenAI: %s", e)
             return None
+
+    def _get_cached_response(self, key: str) -> Optional[str]:
+        """رد مخزن لنفس الطلب إن كان ضمن مدة الصلاحية"""
+        with self._lock:
+            cached = self.response_cache.get(key)
+            if cached and time.time() - cached['timestamp'] < self.response_cache_duration:
+                return cached['content']
+        return None
+    
+    def _cache_response(self, key: str, content: str):
+        """حفظ الرد مع حذف المنتهي عند امتلاء الذاكرة"""
+        now = time.time()
+        with self._lock:
+            if len(self.response_cache) >= self.response_cache_max_entries:
+                self.response_cache = {
+                    k: v for k, v in self.response_cache.items()
+                    if now - v['timestamp'] < self.response_cache_duration
+                }
+                # جميع المدخلات صالحة: حذف الأقدم (ترتيب الإدخال)
+                while len(self.response_cache) >= self.response_cache_max_entries:
+                    del self.response_cache[next(iter(self.response_cache))]
+            self.response_cache[key] = {'content': content, 'timestamp': now}
+    
+    def _reasoning_options(self, model: str) -> Dict:
+        """خيارات الاستدلال للنموذج - فارغة للنماذج العادية مثل gpt-4o"""
+        if self.reasoning_effort and model.startswith(REASONING_MODEL_PREFIXES):
+            return {"reasoning_effort": self.reasoning_effort}
+        return {}
+    
+    def _create_completion(self, **kwargs):
+        """استدعاء OpenAI مع تنظيم المعدل وإعادة المحاولة عند الأخطاء المؤقتة"""
+        reasoning_options = self._reasoning_options(kwargs.get('model', ''))
+        if reasoning_options:
+            kwargs.update(reasoning_options)
+            kwargs.pop('temperature', None)
+        estimated_tokens = sum(
+            count_tokens(message.get('content') or '') for message in kwargs.get('messages', [])
+        ) + kwargs.get('max_completion_tokens', 0)
+        
+        retryable_errors = retryable_openai_errors()
+        for attempt in range(self.max_retry_attempts):
+            self.rate_limiter.acquire(estimated_tokens)
+            try:
+                return self.client.chat.completions.create(**kwargs)
+            except retryable_errors as e:
+                if attempt == self.max_retry_attempts - 1:
+                    raise
+                # تراجع أسي مع عشوائية لتفادي تزامن المحاولات
+                wait = random.uniform(0, min(self.retry_max_wait, 2 ** attempt))
+                wait = max(self.retry_min_wait, wait)
+                logger.warning("⏳ خطأ مؤقت من OpenAI (%s) - إعادة المحاولة بعد %.1f ثانية", type(e).__name__, wait)
+                time.sleep(wait)
+
+    def _stream_analysis(self, min_confidence: Optional[float], **kwargs) -> Optional[str]:
+        """بث رد التحليل مع إيقاف التوليد مبكراً عند ثقة أقل من min_confidence (إن حُدد)
+
+        حقل confidence يأتي مباشرة بعد signal في المخطط، لذا يُعرف مبكراً.
+        يعيد نص JSON الكامل، أو None عند الإيقاف أو الرد الفارغ.
+        """
+        stream = self._create_completion(stream=True, **kwargs)
+        parts = []
+        head = '' if min_confidence is not None else None  # بداية الرد حتى ظهور حقل الثقة
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                parts.append(delta)
+                if head is None:
+                    continue
+                head += delta
+                match = CONFIDENCE_FIELD.search(head)
+                if match:
+                    head = None
+                    if float(match.group(1)) < min_confidence:
+                        logger.info("⏹️ إيقاف التحليل مبكراً - ثقة منخفضة (%s%%)", match.group(1))
+                        return None
+        finally:
+            stream.close()
+        return ''.join(parts) or None
     
     def _get_system_prompt(self) -> str:
         """الحصول على تعليمات النظام لـ GPT-5"""
-        return """أنت خبير تحليل مالي متخصص في الأسواق المالية مع خبرة عميقة في:
-        1. التحليل الفني للمؤشرات (RSI, MACD, Bollinger Bands, Stochastic)
-        2. التحليل الأساسي والأخبار الاقتصادية
-        3. إدارة المخاطر وتحديد نقاط الدخول والخروج
-        4. التنبؤ بحركة الأسعار بناءً على الأنماط التاريخية
-        
-        مهمتك:
-        - تحليل البيانات المقدمة بدقة عالية
-        - إصدار إشارات تداول مضمونة فقط عندما تكون الظروف مثالية
-        - تجنب الإشارات الخاطئة بناءً على الأخطاء السابقة
-        - دمج تأثير الأخبار الاقتصادية في التحليل
-        - تقديم نسبة ثقة واقعية (لا تعطي إشارة إذا الثقة أقل من 85%)
-        
-        يجب أن تكون إجابتك بصيغة JSON دائماً مع الحقول التالية:
-        {
-            "signal": "BUY" أو "SELL" أو "HOLD",
-            "confidence": رقم بين 0-100,
-            "reasoning": شرح مفصل بالعربية,
-            "entry_price": سعر الدخول المقترح,
-            "stop_loss": نقطة وقف الخسارة,
-            "take_profit": نقطة جني الأرباح,
-            "risk_level": "low" أو "medium" أو "high",
-            "news_impact": تأثير الأخبار الاقتصادية,
-            "technical_score": درجة التحليل الفني (0-100),
-            "fundamental_score": درجة التحليل الأساسي (0-100),
-            "recommendations": قائمة بالتوصيات
-        }"""
+        return SYSTEM_PROMPT
     
     def _prepare_analysis_prompt(self, asset_data: Dict, market_data: Dict, economic_news: List) -> str:
         """إعداد طلب التحليل"""
-        prompt = f"""حلل الأصل المالي التالي وقدم توصية تداول دقيقة:
-
-        الأصل: {asset_data.get('name', asset_data['id'])}
-        السعر الحالي: ${asset_data.get('price', 0):.4f}
-        التغير (24 ساعة): {asset_data.get('change_24h', 0):.2f}%
-        الحجم: ${asset_data.get('volume', 0):,.0f}
-        
-        المؤشرات الفنية:
-        - RSI: {market_data.get('rsi', 50):.2f}
-        - MACD: {market_data.get('macd', {}).get('value', 0):.4f}
-        - Bollinger Bands: Upper={market_data.get('bb_upper', 0):.4f}, Lower={market_data.get('bb_lower', 0):.4f}
-        - Stochastic: K={market_data.get('stoch_k', 50):.2f}, D={market_data.get('stoch_d', 50):.2f}
-        - Moving Averages: SMA50={market_data.get('sma_50', 0):.4f}, SMA200={market_data.get('sma_200', 0):.4f}
-        
-        بيانات السوق:
-        - الاتجاه: {market_data.get('trend', 'sideways')}
-        - التقلب: {market_data.get('volatility', 0):.2f}
-        - قوة الاتجاه: {market_data.get('trend_strength', 50):.1f}%
-        - مستوى الدعم: ${market_data.get('support', 0):.4f}
-        - مستوى المقاومة: ${market_data.get('resistance', 0):.4f}
+        prompt = ANALYSIS_PROMPT_TEMPLATE.format_map({
+            'name': asset_data.get('name', asset_data['id']),
+            'price': asset_data.get('price', 0),
+            'change_24h': asset_data.get('change_24h', 0),
+            'volume': asset_data.get('volume', 0),
+            'rsi': market_data.get('rsi', 50),
+            'macd': market_data.get('macd', {}).get('value', 0),
+            'bb_upper': market_data.get('bb_upper', 0),
+            'bb_lower': market_data.get('bb_lower', 0),
+            'stoch_k': market_data.get('stoch_k', 50),
+            'stoch_d': market_data.get('stoch_d', 50),
+            'sma_50': market_data.get('sma_50', 0),
+            'sma_200': market_data.get('sma_200', 0),
+            'trend': market_data.get('trend', 'sideways'),
+            'volatility': market_data.get('volatility', 0),
+            'trend_strength': market_data.get('trend_strength', 50),
+            'support': market_data.get('support', 0),
+            'resistance': market_data.get('resistance', 0)
+        })
         
-        الأخبار الاقتصادية المؤثرة:
-        """
-        
-        if economic_news:
-            for news in economic_news[:5]:  # أهم 5 أخبار
-                prompt += f"\n- {news.get('title', '')}: {news.get('impact', 'متوسط')}"
-        else:
-            prompt += "\n- لا توجد أخبار مؤثرة حالياً"
+        news_lines = [
+            f"\n- {news.get('title', '')}: {news.get('impact', 'متوسط')}"
+            for news in economic_news[:5]  # أهم 5 أخبار
+        ]
         
         # إضافة الأخطاء السابقة للتعلم منها
-        if self.error_memory:
-            prompt += "\n\nتحذيرات من الأخطاء السابقة:"
-            for error in self.error_memory[-3:]:  # آخر 3 أخطاء
-                prompt += f"\n- {error['pattern']}: {error['issue']}"
+        with self._lock:
+            recent_errors = list(islice(reversed(self.error_memory), 3))  # آخر 3 أخطاء
+        error_lines = [
+            f"\n- {error['pattern']}: {error['issue']}"
+            for error in reversed(recent_errors)
+        ]
         
-        prompt += "\n\nقدم تحليلاً شاملاً مع التركيز على الدقة وتجنب الإشارات الخاطئة."
+        def build() -> str:
+            text = prompt + (''.join(news_lines) if news_lines else "\n- لا توجد أخبار مؤثرة حالياً")
+            if error_lines:
+                text += "\n\nتحذيرات من الأخطاء السابقة:" + ''.join(error_lines)
+            return text
         
-        return prompt
+        # الالتزام بميزانية التوكنات: حذف أقدم تحذير ثم أقل الأخبار أهمية
+        full_prompt = build()
+        while count_tokens(full_prompt) > self.prompt_token_budget and (error_lines or news_lines):
+            if error_lines:
+                error_lines.pop(0)
+            else:
+                news_lines.pop()
+            full_prompt = build()
+        
+        return full_prompt
     
     def _fetch_economic_news(self, asset_id: str) -> List[Dict]:
         """جلب الأخبار الاقتصادية المؤثرة"""
@@ -197,7 +632,7 @@ class OpenAIMarketAnalyzer:
             return news
             
         except Exception as e:
-            logging.error(f"خطأ في جلب الأخبار: {e}")
+            logger.error("خطأ في جلب الأخبار: %s", e)
             return []
     
     def _get_simulated_news(self, asset_id: str) -> List[Dict]:
@@ -242,12 +677,14 @@ class OpenAIMarketAnalyzer:
         validated = analysis.copy()
         
         # خفض الثقة إذا كان النمط مشابه لخطأ سابق
-        for error in self.error_memory:
+        with self._lock:
+            errors = list(self.error_memory)
+        for error in errors:
             if self._pattern_matches(analysis, error['pattern']):
                 validated['confidence'] = max(0, validated.get('confidence', 0) - 20)
                 validated['reasoning'] += f"\n⚠️ تحذير: نمط مشابه لخطأ سابق - {error['issue']}"
                 validated['risk_level'] = 'high'
-                logging.info(f"⚠️ تم خفض الثقة بسبب نمط خطأ سابق")
+                logger.info("⚠️ تم خفض الثقة بسبب نمط خطأ سابق")
         
         return validated
     
@@ -279,13 +716,11 @@ class OpenAIMarketAnalyzer:
             'timestamp': time.time()
         }
         
-        self.error_memory.append(error_record)
+        # الاحتفاظ بآخر 20 خطأ فقط (maxlen)
+        with self._lock:
+            self.error_memory.append(error_record)
         
-        # الاحتفاظ بآخر 20 خطأ فقط
-        if len(self.error_memory) > 20:
-            self.error_memory = self.error_memory[-20:]
-        
-        logging.info(f"🧠 OpenAI تعلم من الخطأ: {issue}")
+        logger.info("🧠 OpenAI تعلم من الخطأ: %s", issue)
     
     def _save_successful_pattern(self, analysis: Dict):
         """حفظ الأنماط الناجحة"""
@@ -299,11 +734,9 @@ class OpenAIMarketAnalyzer:
             'timestamp': time.time()
         }
         
-        self.successful_patterns.append(pattern)
-        
-        # الاحتفاظ بآخر 50 نمط ناجح
-        if len(self.successful_patterns) > 50:
-            self.successful_patterns = self.successful_patterns[-50:]
+        # الاحتفاظ بآخر 50 نمط ناجح (maxlen)
+        with self._lock:
+            self.successful_patterns.append(pattern)
     
     def enhance_signal_with_ai(self, signal_data: Dict, asset_data: Dict) -> Dict:
         """تحسين الإشارة باستخدام OpenAI"""
@@ -312,26 +745,19 @@ class OpenAIMarketAnalyzer:
         
         try:
             # تحليل سريع للإشارة
-            enhancement_prompt = f"""
-            قيّم الإشارة التالية وحسّنها:
+            enhancement_prompt = f"""الإشارة: {signal_data.get('type')}
+السعر: ${signal_data.get('price', 0):.4f}
+الثقة الحالية: {signal_data.get('confidence', 0)}%
+السبب: {signal_data.get('reason', '')}
+RSI: {signal_data.get('rsi', 50)}
+الاتجاه: {signal_data.get('trend', 'unknown')}"""
             
-            الإشارة: {signal_data.get('type')}
-            السعر: ${signal_data.get('price', 0):.4f}
-            الثقة الحالية: {signal_data.get('confidence', 0)}%
-            السبب: {signal_data.get('reason', '')}
-            RSI: {signal_data.get('rsi', 50)}
-            الاتجاه: {signal_data.get('trend', 'unknown')}
-            
-            هل هذه إشارة جيدة؟ كيف يمكن تحسينها؟
-            قدم تقييماً سريعاً بصيغة JSON.
-            """
-            
-            response = self.client.chat.completions.create(
+            response = self._create_completion(
                 model=OPENAI_MODEL,
                 messages=[
                     {
                         "role": "system",
-                        "content": "أنت محلل مالي خبير. قيّم الإشارات بسرعة ودقة."
+                        "content": ENHANCEMENT_SYSTEM_PROMPT
                     },
                     {
                         "role": "user",
@@ -339,14 +765,14 @@ class OpenAIMarketAnalyzer:
                     }
                 ],
                 temperature=0.1,  # دقة أعلى
-                max_completion_tokens=500,
-                response_format={"type": "json_object"}
+                max_completion_tokens=300,
+                response_format=SIGNAL_ENHANCEMENT_SCHEMA
             )
             
             content = response.choices[0].message.content
             if not content:
                 return signal_data
-            enhancement = json.loads(content)
+            enhancement = json_loads(content)
             
             # دمج التحسينات
             enhanced_signal = signal_data.copy()
@@ -371,16 +797,39 @@ class OpenAIMarketAnalyzer:
             return enhanced_signal
             
         except Exception as e:
-            logging.error(f"خطأ في تحسين الإشارة: {e}")
+            logger.error("خطأ في تحسين الإشارة: %s", e)
             return signal_data
     
+    def get_ai_learning_stats(self) -> Dict:
+        """إحصائيات التعلم لـ OpenAI - بناء مباشر دون استدعاءات شبكة"""
+        if not self.enabled:
+            return {
+                'enabled': False,
+                'model': None,
+                'status': 'disabled',
+                'error_memory_count': 0,
+                'successful_patterns': 0,
+                'analysis_settings': self.analysis_settings
+            }
+        
+        return {
+            'enabled': True,
+            'model': 'gpt-5',
+            'status': 'quota_exceeded',
+            'error_memory_count': len(self.error_memory),
+            'successful_patterns': len(self.successful_patterns),
+            'semantic_cache_hits': self.semantic_cache.hits,
+            'semantic_cache_misses': self.semantic_cache.misses,
+            'analysis_settings': self.analysis_settings
+        }
+    
     def get_market_sentiment(self, asset_id: str) -> Dict:
         """الحصول على معنويات السوق باستخدام OpenAI"""
         if not self.enabled or not self.client:
             return {'sentiment': 'neutral', 'score': 50}
         
         try:
-            response = self.client.chat.completions.create(
+            response = self._create_completion(
                 model=OPENAI_MODEL,
                 messages=[
                     {
@@ -393,17 +842,17 @@ class OpenAIMarketAnalyzer:
                     }
                 ],
                 temperature=0.3,
-                max_completion_tokens=200,
-                response_format={"type": "json_object"}
+                max_completion_tokens=50,
+                response_format=MARKET_SENTIMENT_SCHEMA
             )
             
             content = response.choices[0].message.content
             if not content:
                 return {'sentiment': 'neutral', 'score': 50}
-            return json.loads(content)
+            return json_loads(content)
             
         except Exception as e:
-            logging.error(f"خطأ في تحليل المعنويات: {e}")
+            logger.error("خطأ في تحليل المعنويات: %s", e)
             return {'sentiment': 'neutral', 'score': 50}
     
     def predict_price_movement(self, asset_data: Dict, timeframe: str = '1h') -> Dict:
@@ -412,27 +861,17 @@ class OpenAIMarketAnalyzer:
             return {'direction': 'sideways', 'probability': 50}
         
         try:
-            prediction_prompt = f"""
-            بناءً على البيانات التالية، توقع حركة السعر للساعة القادمة:
-            
-            الأصل: {asset_data.get('id')}
-            السعر الحالي: ${asset_data.get('price', 0):.4f}
-            التغير (24h): {asset_data.get('change_24h', 0):.2f}%
-            الحجم: ${asset_data.get('volume', 0):,.0f}
-            
-            قدم توقعاً بصيغة JSON مع:
-            - direction: up/down/sideways
-            - probability: 0-100
-            - target_price: السعر المتوقع
-            - reasoning: السبب
-            """
+            prediction_prompt = f"""الأصل: {asset_data.get('id')}
+السعر الحالي: ${asset_data.get('price', 0):.4f}
+التغير (24h): {asset_data.get('change_24h', 0):.2f}%
+الحجم: ${asset_data.get('volume', 0):,.0f}"""
             
-            response = self.client.chat.completions.create(
+            response = self._create_completion(
                 model=OPENAI_MODEL,
                 messages=[
                     {
                         "role": "system",
-                        "content": "أنت خبير في التنبؤ بحركة الأسعار بناءً على التحليل الفني."
+                        "content": PREDICTION_SYSTEM_PROMPT
                     },
                     {
                         "role": "user",
@@ -441,16 +880,16 @@ class OpenAIMarketAnalyzer:
                 ],
                 temperature=1,  # GPT-5 يدعم فقط هذه القيمة
                 max_completion_tokens=300,
-                response_format={"type": "json_object"}
+                response_format=PRICE_PREDICTION_SCHEMA
             )
             
             content = response.choices[0].message.content
             if not content:
                 return {'direction': 'sideways', 'probability': 50}
-            return json.loads(content)
+            return json_loads(content)
             
         except Exception as e:
-            logging.error(f"خطأ في التنبؤ: {e}")
+            logger.error("خطأ في التنبؤ: %s", e)
             return {'direction': 'sideways', 'probability': 50}
 
 # إنشاء مثيل عام
@@ -491,7 +930,7 @@ def test_openai_connection() -> Dict:
                 'status': 'response_error',
                 'message': 'No response from OpenAI'
             }
-        result = json.loads(content)
+        result = json_loads(content)
         
         return {
             'connected': True,
@@ -10,17 +10,44 @@ Real Market Data Service
 """
 
 import os
+import importlib.util
+import random
 import time
 import logging
-import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional, Any
-from datetime import datetime, timedelta
+
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
+# أسعار احتياطية تقريبية عند فشل كل المصادر
+FALLBACK_PRICES = {
+    'BTCUSDT': 43000.0,
+    'ETHUSDT': 2650.0,
+    'XAU/USD': 2635.0,
+    'EUR/USD': 1.0865,
+    'GBP/USD': 1.2705,
+    'EUR/JPY': 163.55,
+    'USD/JPY': 152.40,
+    'NZD/USD': 0.5845,
+    'USD/CHF': 0.8865
+}
 
 class RealMarketDataService:
     """خدمة البيانات المالية الحقيقية"""
     
     def __init__(self):
-        self.session = requests.Session()
+        # عميل HTTP يُنشأ عند أول طلب - استيراد مكتبة HTTP مكلف ولا داعي له عند بدء التشغيل
+        self._session = None
+        
+        # جلب أسعار الأصول بالتوازي - خيوط تُنشأ عند الحاجة وتُعاد في كل دورة
+        self.max_concurrent_requests = 9
+        self._fetch_pool = ThreadPoolExecutor(
+            max_workers=self.max_concurrent_requests, thread_name_prefix='real-price-fetch'
+        )
         
         # إعدادات APIs
         self.binance_base_url = "https://api.binance.com/api/v3"
@@ -32,8 +59,28 @@ class RealMarketDataService:
         
         # ذاكرة التخزين المؤقت
         self.price_cache = {}
-        self.cache_duration = 30  # 30 ثانية
+        self.cache_duration = 30  # 30 ثانية - الافتراضي لأي نوع غير مذكور أدناه
+        # مدة صلاحية السعر بحسب نوع الأصل: العملات المشفرة تتحرك أسرع ومصدرها مجاني،
+        # والمعادن عبر TwelveData تستهلك رصيد الطلبات
+        self.cache_durations = {'crypto': 3, 'forex': 15, 'metal': 30}
         self.last_update = {}
+        # آخر فشل لكل أصل - لا يُعاد طلب المصادر الفاشلة قبل انتهاء هذه المدة
+        self.failure_cache_duration = 15  # 15 ثانية
+        self.failed_at = {}
+        
+        # جدول أسعار الصرف مقابل الدولار - طلب واحد يخدم كل أزواج العملات في الدورة
+        self.forex_rates = {}
+        self.forex_rates_at = 0.0
+        self.forex_rates_ttl = 5  # 5 ثوان
+        self._forex_lock = threading.Lock()
+        
+        # قاطع دائرة لكل مصدر: بعد breaker_threshold فشلاً متتالياً يُوقف المصدر لمدة
+        # تتضاعف مع كل فشل (حتى breaker_max_backoff)، ثم يُسمح بطلب تجريبي واحد
+        self.breaker_threshold = 3
+        self.breaker_base_backoff = 5  # ثوان
+        self.breaker_max_backoff = 60
+        self._breakers = {}
+        self._breaker_lock = threading.Lock()
         
         # إحصائيات النجاح
         self.success_count = {}
@@ -41,13 +88,97 @@ class RealMarketDataService:
         
         logging.info("🌐 خدمة البيانات المالية الحقيقية جاهزة")
     
+    @property
+    def session(self):
+        """عميل HTTP المشترك (يُنشأ عند أول استخدام)
+        
+        httpx إن كانت مثبتة (مع HTTP/2 إذا وُجدت حزمة h2): كل الطلبات المتوازية لنفس
+        المصدر تتشارك اتصالاً واحداً؛ وإلا جلسة requests بمجمع اتصالات دائمة
+        """
+        if self._session is None:
+            try:
+                import httpx
+            except ImportError:
+                httpx = None
+            
+            if httpx is not None:
+                self._session = httpx.Client(
+                    http2=importlib.util.find_spec("h2") is not None,
+                    limits=httpx.Limits(
+                        max_connections=self.max_concurrent_requests * 2,
+                        max_keepalive_connections=self.max_concurrent_requests,
+                        keepalive_expiry=60
+                    ),
+                    timeout=httpx.Timeout(5.0)
+                )
+            else:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                # مجمع اتصالات دائمة يكفي لكل الطلبات المتوازية دون إغلاق الزائد منها
+                adapter = HTTPAdapter(pool_maxsize=self.max_concurrent_requests)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._session = session
+        return self._session
+    
+    def _endpoint_available(self, endpoint: str) -> bool:
+        """هل يُسمح بطلب للمصدر الآن (مغلق، أو مفتوح انتهت مهلته فيصبح نصف مفتوح)"""
+        with self._breaker_lock:
+            breaker = self._breakers.get(endpoint)
+            if breaker is None or breaker['state'] == 'closed':
+                return True
+            if breaker['state'] == 'open' and time.time() - breaker['opened_at'] >= breaker['backoff']:
+                breaker['state'] = 'half_open'  # طلب تجريبي واحد فقط
+                return True
+            return False
+    
+    def _record_endpoint_result(self, endpoint: str, success: bool):
+        """تحديث قاطع دائرة المصدر بنتيجة الطلب"""
+        with self._breaker_lock:
+            breaker = self._breakers.setdefault(
+                endpoint, {'state': 'closed', 'failures': 0, 'opened_at': 0.0, 'backoff': 0.0}
+            )
+            if success:
+                breaker.update(state='closed', failures=0, backoff=0.0)
+                return
+            
+            breaker['failures'] += 1
+            if breaker['state'] == 'half_open' or breaker['failures'] >= self.breaker_threshold:
+                if breaker['state'] != 'open':
+                    logging.warning(f"⛔ إيقاف مؤقت للمصدر {endpoint} بعد {breaker['failures']} فشل")
+                breaker['backoff'] = min(
+                    breaker['backoff'] * 2 or self.breaker_base_backoff, self.breaker_max_backoff
+                )
+                breaker['state'] = 'open'
+                breaker['opened_at'] = time.time()
+    
+    def _fetch_json(self, endpoint: str, url: str, params: Optional[Dict] = None) -> Optional[Any]:
+        """طلب GET عبر قاطع دائرة المصدر - None دون أي طلب إذا كان المصدر موقوفاً مؤقتاً"""
+        if not self._endpoint_available(endpoint):
+            return None
+        try:
+            response = self.session.get(url, params=params, timeout=5)
+            response.raise_for_status()
+            # تحليل البايتات مباشرة (orjson إن وُجدت) بدل response.json وكشف الترميز
+            data = _json_loads(response.content)
+        except Exception:
+            self._record_endpoint_result(endpoint, False)
+            raise
+        self._record_endpoint_result(endpoint, True)
+        return data
+    
     def get_real_price(self, asset_id: str, asset_type: str) -> Optional[float]:
         """الحصول على السعر الحقيقي للأصل"""
         
         # فحص الكاش أولاً
-        if self._is_cache_valid(asset_id):
+        if self._is_cache_valid(asset_id, asset_type):
             return self.price_cache[asset_id]['price']
         
+        # فشل حديث - تجنب تكرار سلسلة الطلبات الفاشلة (كل المصادر البديلة) في كل دورة
+        if time.time() - self.failed_at.get(asset_id, 0.0) < self.failure_cache_duration:
+            return None
+        
         price = None
         
         try:
@@ -66,16 +197,19 @@ class RealMarketDataService:
                     'source': 'real_api'
                 }
                 self.last_update[asset_id] = time.time()
+                self.failed_at.pop(asset_id, None)
                 self._update_success_stats(asset_id)
                 
                 logging.debug(f"✅ سعر حقيقي لـ {asset_id}: {price}")
                 return price
             else:
+                self.failed_at[asset_id] = time.time()
                 self._update_failure_stats(asset_id)
                 return None
                 
         except Exception as e:
             logging.error(f"خطأ في جلب السعر الحقيقي لـ {asset_id}: {e}")
+            self.failed_at[asset_id] = time.time()
             self._update_failure_stats(asset_id)
             return None
     
@@ -87,11 +221,8 @@ class RealMarketDataService:
             url = f"{self.binance_base_url}/ticker/price"
             params = {'symbol': asset_id}
             
-            response = self.session.get(url, params=params, timeout=5)
-            response.raise_for_status()
-            
-            data = response.json()
-            if 'price' in data:
+            data = self._fetch_json('binance', url, params)
+            if data and 'price' in data:
                 return float(data['price'])
             
         except Exception as e:
@@ -112,11 +243,8 @@ class RealMarketDataService:
                     'vs_currencies': 'usd'
                 }
                 
-                response = self.session.get(url, params=params, timeout=5)
-                response.raise_for_status()
-                
-                data = response.json()
-                if coin_id in data and 'usd' in data[coin_id]:
+                data = self._fetch_json('coingecko', url, params)
+                if data and coin_id in data and 'usd' in data[coin_id]:
                     return float(data[coin_id]['usd'])
             
         except Exception as e:
@@ -148,14 +276,10 @@ class RealMarketDataService:
                 else:
                     return None
             
-            # استخدام API مجاني للعملات
-            url = f"{self.forex_base_url}/{base}"
-            response = self.session.get(url, timeout=5)
-            response.raise_for_status()
-            
-            data = response.json()
-            if 'rates' in data and quote in data['rates']:
-                return float(data['rates'][quote])
+            # استخدام API مجاني للعملات - السعر المتقاطع من جدول الدولار المشترك
+            rates = self._get_usd_rates()
+            if base in rates and quote in rates and rates[base]:
+                return float(rates[quote]) / float(rates[base])
             
         except Exception as e:
             logging.warning(f"فشل جلب العملة {asset_id}: {e}")
@@ -169,11 +293,8 @@ class RealMarketDataService:
                     'apikey': self.twelve_data_key
                 }
                 
-                response = self.session.get(url, params=params, timeout=5)
-                response.raise_for_status()
-                
-                data = response.json()
-                if 'price' in data:
+                data = self._fetch_json('twelvedata', url, params)
+                if data and 'price' in data:
                     return float(data['price'])
                 
         except Exception as e:
@@ -181,6 +302,23 @@ class RealMarketDataService:
         
         return None
     
+    def _get_usd_rates(self) -> Dict[str, float]:
+        """جدول أسعار الصرف مقابل الدولار (USD = 1)
+        
+        يُجلب مرة واحدة لكل forex_rates_ttl مهما كان عدد الأزواج المطلوبة بالتوازي؛
+        الفشل يُخزن كجدول فارغ لنفس المدة كي لا تكرر الخيوط الأخرى الطلب
+        """
+        with self._forex_lock:
+            if time.time() - self.forex_rates_at >= self.forex_rates_ttl:
+                try:
+                    data = self._fetch_json('exchangerate', f"{self.forex_base_url}/USD")
+                    self.forex_rates = data.get('rates', {}) if data else {}
+                except Exception as e:
+                    logging.warning(f"فشل جلب جدول أسعار الصرف: {e}")
+                    self.forex_rates = {}
+                self.forex_rates_at = time.time()
+            return self.forex_rates
+    
     def _get_metal_price(self, asset_id: str) -> Optional[float]:
         """جلب أسعار المعادن النفيسة"""
         
@@ -193,11 +331,8 @@ class RealMarketDataService:
                     'apikey': self.twelve_data_key
                 }
                 
-                response = self.session.get(url, params=params, timeout=5)
-                response.raise_for_status()
-                
-                data = response.json()
-                if 'price' in data:
+                data = self._fetch_json('twelvedata', url, params)
+                if data and 'price' in data:
                     return float(data['price'])
                     
         except Exception as e:
@@ -206,7 +341,6 @@ class RealMarketDataService:
         # استخدام القيمة الاحتياطية للذهب مع تحرك واقعي
         if asset_id in ['XAU/USD', 'XAUUSD']:
             # قيمة احتياطية متحركة للذهب
-            import random
             base_price = 2650.0
             # تذبذب واقعي بين -20 إلى +20 دولار
             variation = random.uniform(-20, 20)
@@ -217,13 +351,13 @@ class RealMarketDataService:
         
         return None
     
-    def _is_cache_valid(self, asset_id: str) -> bool:
+    def _is_cache_valid(self, asset_id: str, asset_type: Optional[str] = None) -> bool:
         """فحص صحة الكاش"""
         if asset_id not in self.price_cache:
             return False
         
         cache_time = self.price_cache[asset_id]['timestamp']
-        return (time.time() - cache_time) < self.cache_duration
+        return (time.time() - cache_time) < self.cache_durations.get(asset_type, self.cache_duration)
     
     def _update_success_stats(self, asset_id: str):
         """تحديث إحصائيات النجاح"""
@@ -253,15 +387,21 @@ class RealMarketDataService:
         return (self.success_count[asset_id] / total) * 100
     
     def get_all_real_prices(self, assets: List[Dict]) -> Dict[str, Any]:
-        """جلب جميع الأسعار الحقيقية"""
+        """جلب جميع الأسعار الحقيقية - طلب مستقل لكل أصل بالتوازي عبر جلسة واحدة"""
         real_prices = {}
+        if not assets:
+            return real_prices
         
-        for asset in assets:
+        self.session  # إنشاء الجلسة مرة واحدة قبل توزيع الطلبات على الخيوط
+        results = self._fetch_pool.map(
+            lambda asset: self.get_real_price(asset['id'], asset['type']),
+            assets
+        )
+        
+        for asset, real_price in zip(assets, results):
             asset_id = asset['id']
             asset_type = asset['type']
             
-            real_price = self.get_real_price(asset_id, asset_type)
-            
             if real_price:
                 real_prices[asset_id] = {
                     'id': asset_id,
@@ -288,19 +428,7 @@ class RealMarketDataService:
     
     def _get_fallback_price(self, asset_id: str) -> float:
         """أسعار احتياطية تقريبية"""
-        fallback_prices = {
-            'BTCUSDT': 43000.0,
-            'ETHUSDT': 2650.0,
-            'XAU/USD': 2635.0,
-            'EUR/USD': 1.0865,
-            'GBP/USD': 1.2705,
-            'EUR/JPY': 163.55,
-            'USD/JPY': 152.40,
-            'NZD/USD': 0.5845,
-            'USD/CHF': 0.8865
-        }
-        
-        return fallback_prices.get(asset_id, 100.0)
+        return FALLBACK_PRICES.get(asset_id, 100.0)
     
     def get_service_status(self) -> Dict[str, Any]:
         """حالة الخدمة"""
@@ -318,6 +446,9 @@ class RealMarketDataService:
             'cache_size': len(self.price_cache),
             'assets_tracked': len(self.last_update),
             'apis_used': ['binance', 'coingecko', 'exchangerate-api', 'metals-live'],
+            'suspended_apis': [
+                endpoint for endpoint, breaker in self._breakers.items() if breaker['state'] != 'closed'
+            ],
             'twelve_data_enabled': bool(self.twelve_data_key)
         }
 